@@ -0,0 +1,62 @@
+"""The closed-form DLR fit should agree with iterative training."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from torch.utils.data import DataLoader, TensorDataset  # noqa: E402
+
+from trent.models.dual_loss_regression import (  # noqa: E402
+    Dual_Loss_Regression,
+    model_exec,
+    model_solve,
+)
+
+NUM_FEATURES = 5
+DEVICE = torch.device("cpu")
+
+
+def _loader(n: int, seed: int) -> DataLoader:
+    """A small synthetic (X, y, z) loader with two noisy linear targets."""
+    g = torch.Generator().manual_seed(seed)
+    x = torch.randn(n, NUM_FEATURES, generator=g)
+    y = x @ torch.randn(NUM_FEATURES, 2, generator=g) + 0.1 * torch.randn(
+        n, 2, generator=g
+    )
+    z = torch.rand(n, generator=g)
+    return DataLoader(TensorDataset(x, y, z), batch_size=64)
+
+
+def _fit(fit, *args, **kwargs) -> Dual_Loss_Regression:
+    torch.manual_seed(0)
+    model = Dual_Loss_Regression(NUM_FEATURES, 2)
+    fit(model, DEVICE, _loader(500, 0), _loader(100, 1), *args, **kwargs)
+    return model
+
+
+def test_model_solve_matches_lbfgs():
+    health_weight, econ_weight, l2_lambda = 1.0, 2.0, 0.5
+
+    solved = _fit(model_solve, health_weight, econ_weight, l2_lambda, False, None)
+    trained = _fit(
+        model_exec,
+        health_weight,
+        econ_weight,
+        None,  # learning_rate is unused by LBFGS
+        20,
+        l2_lambda,
+        False,
+        None,
+        optimiser_type="lbfgs",
+    )
+
+    torch.testing.assert_close(solved.weight, trained.weight, atol=1e-4, rtol=0)
+    torch.testing.assert_close(solved.bias, trained.bias, atol=1e-4, rtol=0)
+
+
+def test_model_solve_zero_loss_weight():
+    solved = _fit(model_solve, 1.0, 0.0, 0.5, False, None)
+
+    assert torch.isfinite(solved.weight).all()
+    assert torch.count_nonzero(solved.weight[1]) == 0
+    assert solved.bias[1] == 0
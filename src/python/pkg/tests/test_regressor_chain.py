@@ -0,0 +1,61 @@
+"""The moment-downdated Regressor_Chain should reproduce sklearn's chains."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sklearn")
+
+from sklearn.linear_model import Ridge  # noqa: E402
+from sklearn.multioutput import RegressorChain  # noqa: E402
+
+from trent.abt import sklearn_cv_data as cv_data  # noqa: E402
+from trent.models.regressor_chain import Regressor_Chain  # noqa: E402
+
+L2_LAMBDA = 0.5
+
+
+def _synthetic_abt(path, states: int = 3, counties: int = 10, days: int = 4):
+    """Write a small ABT with the columns the CV orchestrator expects."""
+    rng = np.random.RandomState(0)
+    n = states * counties * days
+
+    state_code = np.repeat(np.arange(states), counties * days)
+    county = np.tile(np.repeat(np.arange(counties), days), states)
+    county_fip = state_code * 1000 + county
+
+    x = rng.normal(size=(n, len(cv_data.features)))
+    y = x @ rng.normal(size=(len(cv_data.features), 2)) + rng.normal(size=(n, 2))
+
+    df = pd.DataFrame(x, columns=cv_data.features)
+    df[cv_data.targets] = y
+    df["acs_pop_total"] = rng.randint(1000, 100000, size=n)
+    df["county_fip"] = county_fip
+    df["state_code"] = state_code
+    df.to_csv(path, index=False)
+
+
+def _sklearn_chain(X, y, order):
+    chain = RegressorChain(Ridge(alpha=L2_LAMBDA), order=order, cv=5)
+    return chain.fit(X, y).estimators_
+
+
+def test_regressor_chain_matches_sklearn(tmp_path):
+    srcfile = tmp_path / "abt.csv"
+    _synthetic_abt(srcfile)
+
+    rc = Regressor_Chain(str(srcfile), folds=5, repeats=2, l2_lambda=L2_LAMBDA, n_jobs=1)
+    health_first, econ_first = rc.execute()
+
+    # The orchestrator is seeded, so iterating it again gives the same folds
+    for i, repeat in enumerate(rc.orchestrator):
+        for k, (tr, _) in enumerate(repeat):
+            X, y = tr[0][0], tr[0][1]
+
+            health, econ = _sklearn_chain(X, y, order=[0, 1])
+            np.testing.assert_allclose(health_first[i][k][0], health.coef_, atol=1e-10)
+            np.testing.assert_allclose(health_first[i][k][1], econ.coef_, atol=1e-10)
+
+            econ, health = _sklearn_chain(X, y, order=[1, 0])
+            np.testing.assert_allclose(econ_first[i][k][0], health.coef_, atol=1e-10)
+            np.testing.assert_allclose(econ_first[i][k][1], econ.coef_, atol=1e-10)
@@ -4,7 +4,8 @@ import logging
 from pathlib import Path
 
 import pandas as pd
-import requests
+
+from trent.data import _http
 
 pd.options.mode.chained_assignment = None
 
@@ -52,12 +53,12 @@ def get_google_mobility():
     logging.info("Downloading Google mobility data")
 
     # request csv & load to pandas dataFrame
-    r = requests.get(url)
+    r = _http.get_session().get(url)
     r.raise_for_status()
     logging.info("Download complete")
 
     return pd.read_csv(
-        io.StringIO(r.content.decode("utf-8")), low_memory=False, parse_dates=["date"]
+        io.BytesIO(r.content), low_memory=False, parse_dates=["date"]
     )
 
 
@@ -1,6 +1,6 @@
 """Datasets and dataloaders for sklearn regression chain model."""
 
-from typing import Generator, Iterable, Tuple
+from typing import Generator, Iterable, Optional, Tuple
 
 import sys
 from pathlib import Path
@@ -38,6 +38,13 @@ targets = [
     'unemployment_pct_delta'
 ]
 
+def read_abt(srcfile: str) -> pd.DataFrame:
+    """Load the ABT, from Parquet if srcfile ends in .parquet, else from CSV."""
+    if Path(srcfile).suffix == ".parquet":
+        return pd.read_parquet(srcfile)
+    return pd.read_csv(srcfile)
+
+
 class RepeatedStratifiedGroupKFoldOrchestrator:
     """Orchestrate repeated, stratified, group-wise, K-fold CV.
 
@@ -59,21 +66,30 @@ class RepeatedStratifiedGroupKFoldOrchestrator:
                     ...
                 for batch in test_dl:
                     ...
+
+    An ABT that is already loaded can be passed as `data=` instead of
+    srcfile, so callers that need it too only read it once.
     """
 
     def __init__(
-        self, srcfile: str, folds: int = 5, repeats: int = 1, seed: int = 0
+        self,
+        srcfile: Optional[str] = None,
+        folds: int = 5,
+        repeats: int = 1,
+        seed: int = 0,
+        data: Optional[pd.DataFrame] = None,
     ):
         """Initialize the orchestrator.
 
         Args:
-            srcfile (str): path to the ABT CSV
+            srcfile (str): path to the ABT CSV or Parquet file
             folds (int): number of CV folds per repeat
             repeats (int): number of repeats, shuffling each time
             batch_size (int): eventual pandas dataloader batch size
+            data (DataFrame): the ABT already loaded, used in place of srcfile
         """
         # Load the data
-        self.data = pd.read_csv(srcfile)
+        self.data = data if data is not None else read_abt(srcfile)
         self.folds = folds
         self.repeats = repeats
         self.seed = seed
@@ -1,6 +1,6 @@
 """Datasets and dataloaders for PyTorch."""
 
-from typing import Generator, Iterable, Tuple
+from typing import Generator, Iterable, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -20,7 +20,8 @@ class RepeatedStratifiedGroupKFoldOrchestrator:
             srcfile="test.csv",
             folds=5,
             repeats=5,
-            batch_size=64
+            batch_size=64,
+            pin_memory=True
         )
 
         for repeat in cv:
@@ -32,7 +33,13 @@ class RepeatedStratifiedGroupKFoldOrchestrator:
     """
 
     def __init__(
-        self, srcfile: str, folds: int = 5, repeats: int = 1, batch_size: int = 1, seed: int = 0
+        self,
+        srcfile: str,
+        folds: int = 5,
+        repeats: int = 1,
+        batch_size: Optional[int] = 1,
+        seed: int = 0,
+        pin_memory: bool = False,
     ):
         """Initialize the orchestrator.
 
@@ -40,7 +47,10 @@ class RepeatedStratifiedGroupKFoldOrchestrator:
             srcfile (str): path to the ABT CSV
             folds (int): number of CV folds per repeat
             repeats (int): number of repeats, shuffling each time
-            batch_size (int): eventual torch dataloader batch size
+            batch_size (int): eventual torch dataloader batch size, or None
+                to load each fold as a single full batch
+            pin_memory (bool): have the dataloaders return batches in
+                page-locked memory, for faster (async) copies to a GPU
         """
         # Load the data
         self.data = pd.read_csv(srcfile)
@@ -48,6 +58,7 @@ class RepeatedStratifiedGroupKFoldOrchestrator:
         self.repeats = repeats
         self.batch_size = batch_size
         self.seed = seed
+        self.pin_memory = pin_memory
 
     def __iter__(self) -> Generator["_StratifiedGroupKFoldOrchestrator", None, None]:
         """Shuffle the dataset and produce a CV orchestrator."""
@@ -61,7 +72,8 @@ class RepeatedStratifiedGroupKFoldOrchestrator:
             yield _StratifiedGroupKFoldOrchestrator(
                 data=self.data.sample(frac=1, random_state=random_states[i]).copy(),
                 folds=self.folds,
-                batch_size=self.batch_size
+                batch_size=self.batch_size,
+                pin_memory=self.pin_memory,
             )
 
 
@@ -82,15 +94,24 @@ class _StratifiedGroupKFoldOrchestrator:
             ...
     """
 
-    def __init__(self, data, folds: int = 5, batch_size: int = 1):
+    def __init__(
+        self,
+        data,
+        folds: int = 5,
+        batch_size: Optional[int] = 1,
+        pin_memory: bool = False,
+    ):
         """Initialize the K-fold CV.
 
         Args:
             folds (int): number of CV folds per repeat
-            batch_size (int): eventual torch dataloader batch size
+            batch_size (int): eventual torch dataloader batch size, or None
+                for one full batch per fold
+            pin_memory (bool): whether the dataloaders pin their batches
         """
         self.folds = folds
         self.batch_size = batch_size
+        self.pin_memory = pin_memory
 
         # Split the data into folds now
         lookup = data.loc[:, ["county_fip", "state_code"]].drop_duplicates()
@@ -115,10 +136,26 @@ class _StratifiedGroupKFoldOrchestrator:
             train_ds = self._make_dataset(folds=train_folds)
             test_ds = self._make_dataset(folds=[ifold])
             yield (
-                DataLoader(train_ds, batch_size=self.batch_size, worker_init_fn=self.__worker_init_fn__),
-                DataLoader(test_ds, batch_size=self.batch_size, worker_init_fn=self.__worker_init_fn__),
+                DataLoader(
+                    train_ds,
+                    batch_size=self._batch_size(train_ds),
+                    pin_memory=self.pin_memory,
+                    worker_init_fn=self.__worker_init_fn__,
+                ),
+                DataLoader(
+                    test_ds,
+                    batch_size=self._batch_size(test_ds),
+                    pin_memory=self.pin_memory,
+                    worker_init_fn=self.__worker_init_fn__,
+                ),
             )
 
+    def _batch_size(self, ds: Dataset) -> int:
+        """Loader batch size for a dataset; None means the whole dataset."""
+        if self.batch_size is None:
+            return max(len(ds), 1)
+        return self.batch_size
+
     def _make_dataset(self, folds: Iterable[int]) -> "_ABTDataset":
         """Make a dataset from a subsetted data frame."""
         sub = self.data.loc[self.data["__fold"].isin(folds), :]
@@ -238,7 +238,14 @@ if __name__ == "__main__":
     Policy_ABT = get_policy_ABT(Policy_df=Policy_df, CDC_df=CDC_df)
 
     # Left join for state codes:
-    fips_states = fips_df[["state", "state_code"]].drop_duplicates()
+    fips_states = fips_df[["state", "state_code"]].drop_duplicates().copy()
+
+    # Join on a shared categorical dtype so the merge hashes integer codes
+    state_dtype = pd.CategoricalDtype(
+        sorted(set(Policy_ABT.state.dropna()).union(fips_states.state.dropna()))
+    )
+    Policy_ABT["state"] = Policy_ABT["state"].astype(state_dtype)
+    fips_states["state"] = fips_states["state"].astype(state_dtype)
     Policy_ABT = pd.merge(
         Policy_ABT, fips_states, how="left", left_on=["state"], right_on=["state"]
     )
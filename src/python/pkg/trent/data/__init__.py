@@ -1,22 +1,26 @@
 """Data management."""
 
 import pathlib
-import requests
+import shutil
 
 # placing this first to avoid circular imports
 DATA_DIR = pathlib.Path(__file__).resolve().parents[5] / "data"
 
-from trent.data import census, cdc_health  # noqa: F401, E402
+from trent.data import _http, census, cdc_health  # noqa: F401, E402
 
 
 def get_covidtracking_data() -> None:
     url = "https://covidtracking.com/api/v1/states/daily.csv"
 
-    r = requests.get(url)
-    r.raise_for_status()
-
     outfile = DATA_DIR / "raw" / "covidtracking.csv"
-    outfile.write_text(r.content.decode(r.encoding))
+    outfile.parent.mkdir(exist_ok=True, parents=True)
+
+    # Stream the (decompressed) body straight to disk
+    with _http.get_session().get(url, stream=True) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        with outfile.open("wb") as f:
+            shutil.copyfileobj(r.raw, f, length=1 << 20)
 
 
 def run_pipeline() -> None:
@@ -0,0 +1,31 @@
+"""Process-wide HTTP session for API calls and data downloads.
+
+Sharing one session keeps connections (and TLS handshakes) alive across
+otherwise unrelated requests, e.g., Census API calls and file downloads.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def _make_session() -> requests.Session:
+    """Create a session with a larger connection pool and retries."""
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3),
+        ),
+    )
+    return session
+
+
+_SESSION = _make_session()
+
+
+def get_session() -> requests.Session:
+    """Return the shared session."""
+    return _SESSION
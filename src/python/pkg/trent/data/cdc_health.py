@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pandas as pd
-import requests
 import logging
 
-from trent.data import DATA_DIR
+from trent.data import DATA_DIR, _http
 
 
 def download_cdc_data() -> None:
@@ -12,22 +12,22 @@ def download_cdc_data() -> None:
     infection_file_path = DATA_DIR / "raw" / "covid_confirmed_usafacts.csv"
 
     logging.info("Downloading covid_confirmed_usafacts.csv")
-    r = requests.get(infection_url)
+    r = _http.get_session().get(infection_url)
     r.raise_for_status()
 
     logging.info(f"Writing covid_confirmed_usafacts.csv to {infection_file_path}")
     infection_file_path.parent.mkdir(exist_ok=True, parents=True)
-    infection_file_path.write_text(r.content.decode("utf-8"))
+    infection_file_path.write_bytes(r.content)
 
     deaths_url = "https://usafactsstatic.blob.core.windows.net/public/data/covid-19/covid_deaths_usafacts.csv"
     deaths_file_path = DATA_DIR / "raw" / "covid_deaths_usafacts.csv"
 
     logging.info("Downloading covid_deaths_usafacts.csv")
-    r = requests.get(deaths_url)
+    r = _http.get_session().get(deaths_url)
     r.raise_for_status()
 
     logging.info(f"Writing covid_deaths_usafacts.csv to {deaths_file_path}")
-    deaths_file_path.write_text(r.content.decode("utf-8"))
+    deaths_file_path.write_bytes(r.content)
 
 
 def transform_cdc_data() -> None:
@@ -101,27 +101,32 @@ def transform_cdc_data() -> None:
         ~(CDC_confirmed.county == "Grand Princess Cruise Ship")
     ]
 
-    # melt data into the required long format
-    CDC_deaths_df = CDC_deaths.melt(
-        id_vars=["county_fip", "county", "state_code"],
-        var_name="date",
-        value_name="deaths",
-    )
-    CDC_confirmed_df = CDC_confirmed.melt(
-        id_vars=["county_fip", "county", "state_code"],
-        var_name="date",
-        value_name="confirmed",
+    # Unpivot both wide tables into the required long format in a single pass.
+    # Rows come out in the same order as DataFrame.melt (date-major), so the
+    # deaths and confirmed values line up by position and need no join.
+    id_cols = ["county_fip", "county", "state_code"]
+    date_cols = [c for c in CDC_deaths.columns if c not in id_cols]
+    n_counties, n_dates = len(CDC_deaths), len(date_cols)
+
+    CDC_full_df = pd.DataFrame(
+        {
+            "county_fip": np.tile(CDC_deaths["county_fip"].values, n_dates),
+            "state_code": np.tile(CDC_deaths["state_code"].values, n_dates),
+            "county": np.tile(CDC_deaths["county"].values, n_dates),
+            "date": np.repeat(np.asarray(date_cols), n_counties),
+            "deaths": CDC_deaths[date_cols].to_numpy().ravel(order="F"),
+        }
     )
 
     # By construction both tables should match up perfectly
     # Add confirmed column to final data frame
-    CDC_full_df = CDC_deaths_df.copy()
-    if all(CDC_confirmed_df.date == CDC_deaths_df.date) & all(
-        CDC_confirmed_df.county_fip == CDC_deaths_df.county_fip
+    if np.array_equal(CDC_confirmed.columns, CDC_deaths.columns) and np.array_equal(
+        CDC_confirmed.county_fip.values, CDC_deaths.county_fip.values
     ):
-        CDC_full_df["confirmed"] = CDC_confirmed_df["confirmed"]
+        CDC_full_df["confirmed"] = CDC_confirmed[date_cols].to_numpy().ravel(order="F")
         logging.info("CDC joined")
     else:
+        CDC_full_df["confirmed"] = np.nan
         logging.info("CDC data not joined")
 
     # Reorder columns:
@@ -8,7 +8,7 @@ Goals: Add features (likely Census data) to the ABT to account for:
  - Other relevant demographic factors re: health outcomes(?)
 
 We're using 2018 ACS5 because it seemsto be more complete for smaller counties. This is
-easy to go back and text by changing _API_DATASET.
+easy to go back and text by changing API_DATASET.
 
 
 ACS tables:
@@ -29,29 +29,41 @@ Output table format:
 
 Usage:
 
-    pop = trent.data.census.get_pop()
+    pop = trent.data.census.get_dem_pop()
 
 
 NB: This product uses the Census Bureau Data API but is not endorsed or certified
 by the Census Bureau.
 """
 
+import functools
 import logging
 import os
+import pathlib
+import pickle
+import tempfile
+import threading
+import time
 from collections import defaultdict
-from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import census
+import numpy as np
 import pandas as pd
 
+from trent.data import _http
+
 __all__ = [
     "check_for_api_key",
+    "clear_metadata_cache",
     "get_dem_age_gender",
     "get_dem_median_hh_income",
     "get_dem_pop",
     "get_dem_race",
     "get_fields_per_county",
     "get_table_per_county",
+    "invalidate_dem_cache",
     "list_fields",
     "list_tables",
 ]
@@ -61,6 +73,7 @@ _API_KEY_NAME = "CENSUS_API_KEY"
 
 # Tracks the session over time
 API_SESSION: Optional[census.core.ACSClient] = None
+_INIT_LOCK = threading.Lock()
 
 # Changing these module constants would change the underlying source
 API_DATASET = "acs5"
@@ -70,6 +83,16 @@ API_YEAR = 2018
 # b/c they have weird non-local effects with one another later.
 _API_TABLES: Dict[str, Dict] = {}
 _API_FIELDS: Dict[str, Dict] = {}
+# Field names per table ("group"), built from _API_FIELDS
+_API_FIELDS_BY_GROUP: Dict[str, List[str]] = {}
+
+# Table and field metadata are fixed per vintage, so keep a copy on disk
+CACHE_DIR = pathlib.Path(os.environ.get("TRENT_CACHE_DIR", "~/.cache/trent"))
+CACHE_DIR = CACHE_DIR.expanduser() / "census"
+CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+
+# Cache entries written by the get_dem_* functions
+_DEM_CACHE_NAMES = ("dem_pop", "dem_race", "dem_age_gender", "dem_median_hh_income")
 
 
 logger = logging.getLogger(__name__)
@@ -100,50 +123,153 @@ def _get_api_client(key: Optional[str] = None) -> census.core.ACSClient:
     Returns:
         census.Census
     """
-    global API_SESSION, _API_FIELDS, _API_TABLES
+    global API_SESSION, _API_FIELDS, _API_FIELDS_BY_GROUP, _API_TABLES
 
+    # Double-checked so threads only take the lock while the client is built
     if API_SESSION is None:
-        if key is None:
-            key = _get_api_key()
-        else:
-            logger.info("Setting API key from string")
-
-        logger.info("Creating new session")
-        co = census.Census(key=key, year=API_YEAR)
-        API_SESSION = getattr(co, API_DATASET)
-
-        # Get the table and field list upon creation
-        if not _API_FIELDS or not _API_TABLES:
-            logger.info("Creating API_TABLES and API_FIELDS")
-            _API_TABLES = list_tables(fmt="dict")
-            _API_FIELDS = list_fields(fmt="dict")
+        with _INIT_LOCK:
+            if API_SESSION is None:
+                if key is None:
+                    key = _get_api_key()
+                else:
+                    logger.info("Setting API key from string")
+
+                logger.info("Creating new session")
+                co = census.Census(key=key, year=API_YEAR, session=_http.get_session())
+                session = getattr(co, API_DATASET)
+
+                # Get the table and field list upon creation
+                if not _API_FIELDS or not _API_TABLES:
+                    logger.info("Creating API_TABLES and API_FIELDS")
+                    tables = _read_through_cache("tables", session.tables)
+                    _API_TABLES = {d["name"]: d for d in tables}
+                    _API_FIELDS = _read_through_cache("fields", session.fields)
+                    _API_FIELDS_BY_GROUP = _read_through_cache(
+                        "fields_by_group", lambda: _index_fields_by_group(_API_FIELDS)
+                    )
+
+                # Publish the client last so other threads never see it half set up
+                API_SESSION = session
     return API_SESSION
 
 
+def _cache_path(name: str) -> pathlib.Path:
+    """Path of a cached object, keyed by the current dataset and year."""
+    return CACHE_DIR / f"{API_DATASET}-{API_YEAR}-{name}.pkl"
+
+
+def _fetch_tables(api_key: Optional[str]) -> List[Dict]:
+    """Table list from the client's metadata, so it is only downloaded once."""
+    _get_api_client(api_key)
+    return list(_API_TABLES.values())
+
+
+def _fetch_fields(api_key: Optional[str]) -> Dict[str, Dict]:
+    """Copy of the client's field metadata, so it is only downloaded once."""
+    _get_api_client(api_key)
+    return dict(_API_FIELDS)
+
+
+def _read_through_cache(name: str, fetch: Callable[[], Any]) -> Any:
+    """Load an object from the disk cache, calling `fetch` on a miss.
+
+    Args:
+        name (str): cache entry name, e.g., "tables"
+        fetch (callable): produces the object when it isn't cached
+
+    Returns:
+        the cached or freshly fetched object
+    """
+    path = _cache_path(name)
+
+    if path.exists() and time.time() - path.stat().st_mtime < CACHE_TTL:
+        logger.info(f"Cache hit for {path.name}")
+        with path.open("rb") as f:
+            return pickle.load(f)
+
+    logger.info(f"Cache miss for {path.name}")
+    obj = fetch()
+
+    # Write to a temporary file first so readers never see a partial pickle
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+        pickle.dump(obj, f)
+    os.replace(f.name, path)
+
+    return obj
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_state_county(
+    fields: Tuple[str, ...], state_fips: str, county_fips: str, api_key: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Memoize county-level API calls; ACS data is fixed within a vintage."""
+    api = _get_api_client(api_key)
+    return api.state_county(
+        fields=list(fields), state_fips=state_fips, county_fips=county_fips
+    )
+
+
+def _remove_cache_entries(names: Iterable[str]) -> None:
+    """Delete the named entries from the disk cache, if present."""
+    for name in names:
+        path = _cache_path(name)
+        if path.exists():
+            logger.info(f"Removing {path}")
+            path.unlink()
+
+
+def _disk_cached(name: str) -> Callable[[Callable], Callable]:
+    """Decorate a fetch function so its result goes through the disk cache.
+
+    The key only includes `name` (plus the dataset and year), so this is
+    meant for functions whose arguments don't change the result.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return _read_through_cache(name, lambda: fn(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def _index_fields_by_group(fields: Dict[str, Dict]) -> Dict[str, List[str]]:
+    """Index sorted field names by the table ("group") they belong to."""
+    index: Dict[str, List[str]] = defaultdict(list)
+    for k in sorted(fields):
+        index[fields[k]["group"]].append(k)
+    return dict(index)
+
+
 def _get_fields_for_table(tbl: str, api_key: Optional[str] = None) -> List[str]:
     """Collect all fields associated with a Census table."""
-    if not _API_FIELDS:
+    if not _API_FIELDS_BY_GROUP:
         _init_api(key=api_key)
-    return sorted(k for k in _API_FIELDS if _API_FIELDS[k]["group"] == tbl)
+    return _API_FIELDS_BY_GROUP.get(tbl, [])
 
 
 def _translate_state_county_result(
-    result: List[Dict],
+    result: Union[List[Dict], pd.DataFrame],
     map_dict: Optional[Dict[str, str]] = None,
-    map_fn: Optional[Callable[[Dict], Dict]] = None,
-) -> List[Dict]:
-    """Map an API result (list[dict]) to an aggregated/better named version.
+    map_fn: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+) -> pd.DataFrame:
+    """Map an API result to an aggregated/better named, typed DataFrame.
 
     Args:
-        result (list[dict]): the API output, including *at least*
-            "state" and "county"
+        result (list[dict] or DataFrame): the API output, including
+            *at least* "state" and "county"
         map_dict (dict[str, str]): a mapper from Census fields to usable
             column names
-        map_fn (callable, dict->dict): a mapping *function* from a Census
-            results dict to some other arbitrary dict (e.g., for column ops)
+        map_fn (callable, DataFrame->DataFrame): a mapping *function* from
+            the Census results as a DataFrame to a DataFrame of arbitrary
+            columns (e.g., for column ops)
 
     Returns:
-        (list[dict]) a transformed version of the input list
+        (DataFrame) a transformed version of the input, with categorical
+            FIPS codes and nullable integer ("Int64") values
 
     NOTE: One and only one of `map_dict` and `map_fn` should be specified.
     """
@@ -152,36 +278,44 @@ def _translate_state_county_result(
     if (map_dict is not None) == (map_fn is not None):
         raise ValueError("one of map_dict and map_fn must be given")
 
-    output: List[Dict] = []
+    df = pd.DataFrame(result)
 
     # Simple, dict-based mapper
     if map_dict is not None:
         logger.info("Translating result using map_dict")
 
-        for d in result:
-            entry = {"state_fips": d["state"], "county_fips": d["county"]}
-            for old, new in map_dict.items():
-                entry[new] = d[old]
-            output.append(entry)
-        return output
+        output = df.rename(
+            columns={"state": "state_fips", "county": "county_fips", **map_dict}
+        )
+        output = output.loc[:, ["state_fips", "county_fips", *map_dict.values()]]
+        return _set_result_dtypes(output)
 
     # Functional wrapper
     if map_fn is not None:
         logger.info("Translating result using map_fn")
 
-        for d in result:
-            entry = {"state_fips": d["state"], "county_fips": d["county"]}
-            for k, v in map_fn(d).items():
-                entry[k] = v
-            output.append(entry)
-        return output
+        output = pd.DataFrame({"state_fips": df["state"], "county_fips": df["county"]})
+        output = pd.concat([output, map_fn(df)], axis=1)
+        return _set_result_dtypes(output)
 
     raise ValueError("unexpected function exit; neither map_dict nor map_fn were used")
 
 
+def _set_result_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Give a translated result explicit dtypes instead of object columns.
+
+    The FIPS codes repeat across every table, so they're stored as
+    categories. Every get_dem_* call covers the same counties, so the
+    (sorted) categories match between tables and merges use the codes.
+    """
+    dtypes = {c: "Int64" for c in df.columns}
+    dtypes.update({"state_fips": "category", "county_fips": "category"})
+    return df.astype(dtypes)
+
+
 def _mark_missings_as_na(
-    result: List[Dict], exclude_cols: Iterable[str] = ()
-) -> List[Dict]:
+    result: Union[List[Dict], pd.DataFrame], exclude_cols: Iterable[str] = ()
+) -> pd.DataFrame:
     """Selectively mark Census results < 0 or None as NA.
 
     Census items (e.g., median HH income) seem to return large
@@ -191,27 +325,26 @@ def _mark_missings_as_na(
     This should be called _before_ any mapping!
 
     Args:
-        result (list[dict]): the Census API output
+        result (list[dict] or DataFrame): the Census API output
         exclude_cols (iterable): columns to exclude from this task
 
     Returns:
-        (list[dict])  a transformed version of the input
+        (DataFrame)  a transformed copy of the input
     """
-    cols_to_exclude = {"state", "county"}.union(exclude_cols)
-    # Count the values we changed
-    missing_counts: Dict[Any, int] = defaultdict(lambda: 0)
-    output = []
-    for entry in result:
-        for field in set(entry).difference(cols_to_exclude):
-            if entry[field] is None or entry[field] < 0:
-                missing_counts[entry[field]] += 1
-                entry[field] = pd.NA
-        output.append(entry)
+    df = pd.DataFrame(result, copy=True)
+    num_cols = df.columns.difference(["state", "county", *exclude_cols])
+
+    values = df[num_cols]
+    nulls = values.isna().to_numpy()
+    negatives = values.lt(0).to_numpy()
 
-    for k in missing_counts:
-        logger.info(f"Marked {missing_counts[k]} {k} results as NA")
+    # Count the values we changed
+    logger.info(
+        f"Marked {negatives.sum()} negative and {nulls.sum()} None results as NA"
+    )
 
-    return output
+    df[num_cols] = values.mask(nulls | negatives, pd.NA)
+    return df
 
 
 # Public functions -------------------------------------------------------------
@@ -223,6 +356,16 @@ def check_for_api_key() -> None:
         raise KeyError(f"{_API_KEY_NAME} not found on the environment")
 
 
+def clear_metadata_cache() -> None:
+    """Remove the cached table and field lists for the current dataset and year."""
+    _remove_cache_entries(("tables", "fields", "fields_by_group"))
+
+
+def invalidate_dem_cache() -> None:
+    """Remove the cached get_dem_* results for the current dataset and year."""
+    _remove_cache_entries(_DEM_CACHE_NAMES)
+
+
 def list_tables(
     api_key: Optional[str] = None, fmt: str = "DataFrame"
 ) -> Union[pd.DataFrame, Dict[str, Dict]]:
@@ -237,14 +380,13 @@ def list_tables(
     """
     logger.info("Generating table list")
 
-    api = _get_api_client(api_key)
-    tables = api.tables()
+    tables = _read_through_cache("tables", lambda: _fetch_tables(api_key))
 
     # Tables is a list of dict, so reformat and return
     if fmt.lower() == "dict":
         return {d["name"]: d for d in tables}
 
-    return pd.DataFrame([{k: t[k] for k in t if k != "variables"} for t in tables])
+    return pd.DataFrame(tables).drop(columns=["variables"], errors="ignore")
 
 
 def list_fields(
@@ -261,24 +403,17 @@ def list_fields(
     """
     logger.info("Generating fields list")
 
-    api = _get_api_client(api_key)
-    fields: Dict = api.fields()
+    fields: Dict = _read_through_cache("fields", lambda: _fetch_fields(api_key))
 
     # fields is a dict keyed by the field name
     if fmt.lower() == "dict":
         return fields
 
     # Unwrap the API result for pandas
-    reformatted = []
-    if "ucgid" in fields:
-        del fields["ucgid"]
-    for k in fields:
-        dd = {"field": k}
-        for j in fields[k]:
-            dd[j] = fields[k][j]
-        reformatted.append(dd)
-
-    return pd.DataFrame(reformatted)
+    fields.pop("ucgid", None)
+    df = pd.DataFrame.from_dict(fields, orient="index")
+    df.index.name = "field"
+    return df.reset_index()
 
 
 def get_fields_per_county(
@@ -300,10 +435,9 @@ def get_fields_per_county(
     """
     logger.info("Gathering fields per county")
 
-    api = _get_api_client(api_key)
-    return api.state_county(
-        fields=fields, state_fips=state_fips, county_fips=county_fips
-    )
+    # Copy the cached rows so callers can't modify the cache
+    rows = _cached_state_county(tuple(sorted(fields)), state_fips, county_fips, api_key)
+    return [dict(d) for d in rows]
 
 
 def get_table_per_county(
@@ -331,14 +465,15 @@ def get_table_per_county(
     )
 
 
-def get_dem_pop(api_key: Optional[str] = None,) -> List[Dict]:
+@_disk_cached("dem_pop")
+def get_dem_pop(api_key: Optional[str] = None,) -> pd.DataFrame:
     """Collect per-county population.
 
     Args:
         api_key (optional str): API key
 
     Returns:
-        (list[dict]) rows of a data frame, keys are
+        (DataFrame) one row per county, keyed by
             'state_fips' and 'county_fips'
     """
     result = get_fields_per_county(["B01003_001E"], api_key=api_key)
@@ -349,14 +484,15 @@ def get_dem_pop(api_key: Optional[str] = None,) -> List[Dict]:
     return result
 
 
-def get_dem_race(api_key: Optional[str] = None,) -> List[Dict]:
+@_disk_cached("dem_race")
+def get_dem_race(api_key: Optional[str] = None,) -> pd.DataFrame:
     """Collect a racial demographics by county.
 
     Args:
         api_key (optional str): API key
 
     Returns:
-        (list[dict]) rows of a data frame, keys are
+        (DataFrame) one row per county, keyed by
             'state_fips' and 'county_fips'
     """
     FIELDS_MAP = {
@@ -378,57 +514,71 @@ def get_dem_race(api_key: Optional[str] = None,) -> List[Dict]:
     return result
 
 
-def get_dem_age_gender(api_key: Optional[str] = None,) -> List[Dict]:
+_AGE_LABELS = [
+    "acs_age_lt_05",
+    "acs_age_05_09",
+    "acs_age_10_14",
+    "acs_age_15_17",
+    "acs_age_18_19",
+    "acs_age_20",
+    "acs_age_21",
+    "acs_age_22_24",
+    "acs_age_25_29",
+    "acs_age_30_34",
+    "acs_age_35_39",
+    "acs_age_40_44",
+    "acs_age_45_49",
+    "acs_age_50_54",
+    "acs_age_55_59",
+    "acs_age_60_61",
+    "acs_age_62_64",
+    "acs_age_65_66",
+    "acs_age_67_69",
+    "acs_age_70_74",
+    "acs_age_75_79",
+    "acs_age_80_84",
+    "acs_age_85_up",
+]
+# Per-gender counts for each age bucket, in the same order as _AGE_LABELS
+_AGE_MALE_FIELDS = [f"B01001_{i:03d}E" for i in range(3, 26)]
+_AGE_FEMALE_FIELDS = [f"B01001_{i:03d}E" for i in range(27, 50)]
+
+
+def _map_age_gender(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate per-gender age brackets of table B01001."""
+    o = pd.DataFrame(index=df.index)
+    # Add in the total gender populations
+    o["acs_gender_total"] = df["B01001_001E"]
+    o["acs_gender_male"] = df["B01001_002E"]
+    o["acs_gender_female"] = df["B01001_026E"]
+    # Compute per-bucket totals for each age range in one array add,
+    # keeping NA wherever either gender's count is missing
+    male, female = df[_AGE_MALE_FIELDS], df[_AGE_FEMALE_FIELDS]
+    missing = male.isna().to_numpy() | female.isna().to_numpy()
+    buckets = male.fillna(0).to_numpy(np.int64) + female.fillna(0).to_numpy(np.int64)
+    ages = pd.DataFrame(buckets, index=df.index, columns=_AGE_LABELS)
+    return pd.concat([o, ages.mask(missing, pd.NA)], axis=1)
+
+
+@_disk_cached("dem_age_gender")
+def get_dem_age_gender(api_key: Optional[str] = None,) -> pd.DataFrame:
     """Collect age & gender demographics by county.
 
     Args:
         api_key (optional str): API key
 
     Returns:
-        (list[dict]) rows of a data frame, keys are
+        (DataFrame) one row per county, keyed by
             'state_fips' and 'county_fips'
     """
-
-    def _mapper(d: Dict) -> Dict:
-        """Custom mapper to aggregate per-gender age brackets."""
-        o = {}
-        # Add in the total gender populations
-        o["acs_gender_total"] = d["B01001_001E"]
-        o["acs_gender_male"] = d["B01001_002E"]
-        o["acs_gender_female"] = d["B01001_026E"]
-        # Compute per-bucket totals for each age range
-        o["acs_age_lt_05"] = d["B01001_003E"] + d["B01001_027E"]
-        o["acs_age_05_09"] = d["B01001_004E"] + d["B01001_028E"]
-        o["acs_age_10_14"] = d["B01001_005E"] + d["B01001_029E"]
-        o["acs_age_15_17"] = d["B01001_006E"] + d["B01001_030E"]
-        o["acs_age_18_19"] = d["B01001_007E"] + d["B01001_031E"]
-        o["acs_age_20"] = d["B01001_008E"] + d["B01001_032E"]
-        o["acs_age_21"] = d["B01001_009E"] + d["B01001_033E"]
-        o["acs_age_22_24"] = d["B01001_010E"] + d["B01001_034E"]
-        o["acs_age_25_29"] = d["B01001_011E"] + d["B01001_035E"]
-        o["acs_age_30_34"] = d["B01001_012E"] + d["B01001_036E"]
-        o["acs_age_35_39"] = d["B01001_013E"] + d["B01001_037E"]
-        o["acs_age_40_44"] = d["B01001_014E"] + d["B01001_038E"]
-        o["acs_age_45_49"] = d["B01001_015E"] + d["B01001_039E"]
-        o["acs_age_50_54"] = d["B01001_016E"] + d["B01001_040E"]
-        o["acs_age_55_59"] = d["B01001_017E"] + d["B01001_041E"]
-        o["acs_age_60_61"] = d["B01001_018E"] + d["B01001_042E"]
-        o["acs_age_62_64"] = d["B01001_019E"] + d["B01001_043E"]
-        o["acs_age_65_66"] = d["B01001_020E"] + d["B01001_044E"]
-        o["acs_age_67_69"] = d["B01001_021E"] + d["B01001_045E"]
-        o["acs_age_70_74"] = d["B01001_022E"] + d["B01001_046E"]
-        o["acs_age_75_79"] = d["B01001_023E"] + d["B01001_047E"]
-        o["acs_age_80_84"] = d["B01001_024E"] + d["B01001_048E"]
-        o["acs_age_85_up"] = d["B01001_025E"] + d["B01001_049E"]
-        return o
-
     table = get_table_per_county("B01001", api_key=api_key)
     result = _mark_missings_as_na(table)
-    result = _translate_state_county_result(result, map_fn=_mapper)
+    result = _translate_state_county_result(result, map_fn=_map_age_gender)
     return result
 
 
-def get_dem_median_hh_income(api_key: Optional[str] = None,) -> List[Dict]:
+@_disk_cached("dem_median_hh_income")
+def get_dem_median_hh_income(api_key: Optional[str] = None,) -> pd.DataFrame:
     """Collect median household income by county.
 
     This data is spread across multiple tables, as we might want to
@@ -449,7 +599,7 @@ def get_dem_median_hh_income(api_key: Optional[str] = None,) -> List[Dict]:
         api_key (optional str): API key
 
     Returns:
-        (list[dict]) rows of a data frame, keys are
+        (DataFrame) one row per county, keyed by
             'state_fips' and 'county_fips'
     """
     FIELDS = {
@@ -464,7 +614,19 @@ def get_dem_median_hh_income(api_key: Optional[str] = None,) -> List[Dict]:
         "B19013H_001E": "acs_median_hh_inc_white_non_hispanic",
         "B19013I_001E": "acs_median_hh_inc_hispanic",
     }
-    result = get_fields_per_county(list(FIELDS.keys()), api_key=api_key)
+    # Fetch the fields in chunks concurrently and join the pieces per county.
+    # Create the client up front so the worker threads share it.
+    _get_api_client(api_key)
+    fields = list(FIELDS.keys())
+    chunks = [fields[i : i + 5] for i in range(0, len(fields), 5)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        partials = list(
+            executor.map(lambda f: get_fields_per_county(f, api_key=api_key), chunks)
+        )
+    result = pd.concat(
+        [pd.DataFrame(p).set_index(["state", "county"]) for p in partials], axis=1
+    ).reset_index()
+
     result = _mark_missings_as_na(result)
     result = _translate_state_county_result(result, map_dict=FIELDS)
 
@@ -1,102 +1,126 @@
 #!/usr/bin/env python3
+import io
 import pandas as pd
 import numpy as np
-from datetime import timedelta
 import logging
+from typing import Tuple
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
+# Fetch S3 objects in 16 MiB parts over several connections
+S3_TRANSFER_CONFIG = TransferConfig(multipart_chunksize=16 * 1024 * 1024, max_concurrency=8)
 
-def get_labour_data() -> pd.DataFrame:
+
+def get_labour_data(bucket: str) -> pd.DataFrame:
     """Source DoL data from S3 bucket
     [include link to S3 bucket]
+    :param: name of the S3 bucket holding the DoL file
     """
 
-    bucket = 
     file_name = "DOL ar539 simplified (Unemployment Claims by State by week).xlsx"
 
-    # Read in the file:
+    # Read in the file, as concurrent ranged parts, into memory:
     s3 = boto3.client('s3')
+    buffer = io.BytesIO()
 
     try:
-        obj = s3.get_object(Bucket=bucket, Key=file_name)
+        s3.download_fileobj(bucket, file_name, buffer, Config=S3_TRANSFER_CONFIG)
     except ClientError as e:
         logging.error(e)
         return False
 
     # Read object into pandas df
-    df = pd.read_csv(
-                    obj['Body'], 
+    buffer.seek(0)
+    df = pd.read_excel(
+                    buffer,
                     header=4,
                     usecols="A:H"
                     )
 
     return df
 
-def date_parser(x):
+def date_parser(dates: pd.Series) -> pd.Series:
     """
-    Converts current mismatched (2 forms) date to single consistent date format
-    :param: current date format
-    :return: new consistent date format
+    Converts current mismatched (2 forms) dates to single consistent date format
+    Entries read in as 2020-DD-MM have their day and month swapped back
+    :param: column of dates in either format
+    :return: column of consistent datetimes
     """
 
-    x_str = str(x)
+    dates_str = dates.astype(str)
+    swapped = dates_str.str[:4] == '2020'
+
+    parsed = pd.to_datetime(dates_str.where(swapped).str[:10], format='%Y-%d-%m', errors='coerce')
+
+    return parsed.fillna(pd.to_datetime(dates.where(~swapped), dayfirst=False, yearfirst=False))
+
+
+def daily_interp(total_claims: np.ndarray, changed_unemployment: np.ndarray,
+                 week_offset: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spreads each week's change in unemployment evenly over its days
+    and interpolates the total claims back from the week end
+    :param: weekly total claims, weekly changed unemployment and days before week end
+    :return: daily unemployment change and interpolated total claims
+    """
+
+    daily_change = np.floor_divide(changed_unemployment, 7)
+
+    # reuse one buffer for the interpolation rather than allocating per step
+    interp = np.multiply(daily_change, week_offset)
+    np.subtract(total_claims, interp, out=interp)
 
-    if x_str[:4] == '2020': 
-        day = x_str[5:7]
-        month = x_str[8:10]
-        year = x_str[:4]
-        x_form = pd.to_datetime(f'{int(year)}-{int(month)}-{int(day)}') 
-        
-    else: x_form = pd.to_datetime(x, dayfirst=False, yearfirst=False)
-        
-    return x_form
+    return daily_change, interp
 
 
-def labour_data_transformation() -> pd.DataFrame:
+def labour_data_transformation(bucket: str) -> pd.DataFrame:
     """
     Take raw table as provided by the DoL then:
     Reformat the dates to be consistent
     Calculate change in unemployment and newly employed
     Extend weekly data to daily data
     Calculate daily change and interpolated figures
+    :param: name of the S3 bucket holding the DoL file
     :return: the final labour data table for the ABT
     """
 
-    labour_df = get_labour_data()
+    labour_df = get_labour_data(bucket)
 
     # Reformat the dates to be consistent
-    labour_df['Filed week ended'] = labour_df['Filed week ended'].apply(date_parser)
-    labour_df['Reflecting Week Ended'] = labour_df['Reflecting Week Ended'].apply(date_parser)
+    labour_df['Filed week ended'] = date_parser(labour_df['Filed week ended'])
+    labour_df['Reflecting Week Ended'] = date_parser(labour_df['Reflecting Week Ended'])
 
     # Calculate change in unemployment and newly employed
     labour_df['Last Week Unemployed'] = labour_df['Total Claims'].shift(1)
-    labour_df['New_state'] = (labour_df['State'] != labour_df['State'].shift(1)).astype(int)
-    labour_df['Last Week Unemployed'] = labour_df.apply(lambda x: x['Total Claims'] if x['New_state'] == 1
-                                                        else x['Last Week Unemployed'], axis=1
-                                                    )
+    new_state = labour_df['State'] != labour_df['State'].shift(1)
+    labour_df['Last Week Unemployed'] = np.where(new_state,
+                                                 labour_df['Total Claims'], labour_df['Last Week Unemployed']
+                                                 )
     labour_df['Changed Unemployment'] = labour_df['Total Claims'] - labour_df['Last Week Unemployed']
 
     labour_df['Newly Employed'] = labour_df['Last Week Unemployed'] - labour_df['Continued Claims']
-    labour_df['Newly Employed'] = labour_df['Newly Employed'].apply(lambda x: max(0, x))
+    labour_df['Newly Employed'] = np.maximum(labour_df['Newly Employed'], 0)
 
-    labour_df.drop(columns=['Last Week Unemployed', 'New_state'], inplace=True)
+    labour_df.drop(columns=['Last Week Unemployed'], inplace=True)
 
     # Extend weekly data to daily data
-    labour_df_ext = pd.DataFrame(np.repeat(labour_df.values,7,axis=0))
-    labour_df_ext.columns = labour_df.columns
+    labour_df_ext = labour_df.loc[labour_df.index.repeat(7)].reset_index(drop=True)
     labour_df_ext.sort_values(by=['State','Filed week ended'], inplace=True)
 
     # Calculate daily change and interpolated figures
-    labour_df_ext['New_state'] = (labour_df_ext['State'] != labour_df_ext['State'].shift(1)).astype(int)
-    labour_df_ext['Week_Offset'] = 6 - np.remainder(labour_df_ext.index.values,7)
-    labour_df_ext['Date'] = labour_df_ext.apply(lambda x: x['Reflecting Week Ended'] - timedelta(days=x['Week_Offset']), axis=1)
-    labour_df_ext['Daily_Unemployment_Change'] = labour_df_ext.groupby(['State','Reflecting Week Ended'])['Changed Unemployment']\
-                                                .transform(lambda x: x // 7)
-    labour_df_ext['Daily_Interp_Total_Claims'] = labour_df_ext['Total Claims'] - \
-                                            labour_df_ext['Daily_Unemployment_Change']*labour_df_ext['Week_Offset']
-
-    labour_df_ext.drop(columns=['New_state','Week_Offset'], inplace=True)
+    # each week is now a sorted block of 7 days, counting down to the week end
+    labour_df_ext['Week_Offset'] = np.tile(np.arange(6, -1, -1, dtype=np.int8), len(labour_df))
+    labour_df_ext['Date'] = labour_df_ext['Reflecting Week Ended'] - \
+                            pd.to_timedelta(labour_df_ext['Week_Offset'], unit='D')
+    daily_change, daily_total = daily_interp(labour_df_ext['Total Claims'].to_numpy(),
+                                             labour_df_ext['Changed Unemployment'].to_numpy(),
+                                             labour_df_ext['Week_Offset'].to_numpy()
+                                             )
+    labour_df_ext['Daily_Unemployment_Change'] = daily_change
+    labour_df_ext['Daily_Interp_Total_Claims'] = daily_total
+
+    labour_df_ext.drop(columns=['Week_Offset'], inplace=True)
 
     return labour_df_ext
 
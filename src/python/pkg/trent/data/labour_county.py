@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
+import hashlib
 import pandas as pd
 import numpy as np
-from datetime import timedelta
 import logging
+from functools import lru_cache
+from typing import Dict, Tuple
+from pandas.api.types import union_categoricals
 
 from pathlib import Path
 data_dir = Path(__file__).resolve().parents[5] / "data"
 
+def read_excel_cached(file_path: Path, **kwargs) -> pd.DataFrame:
+    """Read an Excel sheet, caching the parsed table as a pickle next to it
+    Each set of read arguments gets its own cache file, and the cache is
+    rebuilt whenever the workbook is modified after it
+    :param: path of the workbook, plus any pd.read_excel arguments
+    :return: the parsed table
+    """
+
+    kwargs_key = hashlib.sha1(repr(sorted(kwargs.items())).encode()).hexdigest()[:12]
+    cache_path = file_path.with_suffix(f"{file_path.suffix}.{kwargs_key}.pkl")
+
+    if cache_path.exists() and cache_path.stat().st_mtime >= file_path.stat().st_mtime:
+        return pd.read_pickle(cache_path)
+
+    df = pd.read_excel(file_path, **kwargs)
+    df.to_pickle(cache_path)
+
+    return df
+
 def get_DoL_data() -> pd.DataFrame:
     """Source DoL weekly state unemployment data from data folder
     url = https://oui.doleta.gov/unemploy/claims.asp
@@ -17,8 +39,8 @@ def get_DoL_data() -> pd.DataFrame:
     file_path = data_dir / file_name
 
     # Read object into pandas df
-    df = pd.read_excel(
-                    file_path, 
+    df = read_excel_cached(
+                    file_path,
                     header=4,
                     usecols="A:H"
                     )
@@ -35,8 +57,8 @@ def get_DoL_county_data() -> pd.DataFrame:
     file_path = data_dir / file_name
 
     # Read object into pandas df
-    df = pd.read_excel(
-                    file_path, 
+    df = read_excel_cached(
+                    file_path,
                     header=None,
                     skiprows=6,
                     usecols="A:J",
@@ -45,10 +67,12 @@ def get_DoL_county_data() -> pd.DataFrame:
 
     return df
 
-def get_fips_data():
+@lru_cache(maxsize=1)
+def get_fips_data() -> Tuple[Dict, Dict]:
     """Source fips data from data folder
     url = https://en.wikipedia.org/wiki/List_of_United_States_FIPS_codes_by_county, https://en.wikipedia.org/wiki/Federal_Information_Processing_Standard_state_code
     create state and state_fip code map for later use
+    the maps are cached, so the file is only read once per process
     """
 
     file_name = "fips.csv"
@@ -60,30 +84,26 @@ def get_fips_data():
                     file_path
                     )
 
-    state_map={k: list(v)[0] for k, v in fips_df.groupby('state')['state_code']}
-    state_fip_map={k: list(v)[0] for k, v in fips_df.groupby('state_fip')['state_code']}
+    state_map = fips_df.drop_duplicates('state').set_index('state')['state_code'].to_dict()
+    state_fip_map = fips_df.drop_duplicates('state_fip').set_index('state_fip')['state_code'].to_dict()
 
 
     return state_map, state_fip_map
 
-def date_parser(x):
+def date_parser(dates: pd.Series) -> pd.Series:
     """
-    Converts current mismatched (2 forms) date to single consistent date format
-    :param: current date format
-    :return: new consistent date format
+    Converts current mismatched (2 forms) dates to single consistent date format
+    Entries read in as 2020-DD-MM have their day and month swapped back
+    :param: column of dates in either format
+    :return: column of consistent datetimes
     """
 
-    x_str = str(x)
+    dates_str = dates.astype(str)
+    swapped = dates_str.str[:4] == '2020'
 
-    if x_str[:4] == '2020': 
-        day = x_str[5:7]
-        month = x_str[8:10]
-        year = x_str[:4]
-        x_form = pd.to_datetime(f'{int(year)}-{int(month)}-{int(day)}') 
-        
-    else: x_form = pd.to_datetime(x, dayfirst=False, yearfirst=False)
-        
-    return x_form
+    parsed = pd.to_datetime(dates_str.where(swapped).str[:10], format='%Y-%d-%m', errors='coerce')
+
+    return parsed.fillna(pd.to_datetime(dates.where(~swapped), dayfirst=False, yearfirst=False))
 
 
 def labour_state_transformation() -> pd.DataFrame:
@@ -100,43 +120,48 @@ def labour_state_transformation() -> pd.DataFrame:
     labour_df = get_DoL_data()
 
     # Reformat the dates to be consistent
-    labour_df['Filed week ended'] = labour_df['Filed week ended'].apply(date_parser)
-    labour_df['Reflecting Week Ended'] = labour_df['Reflecting Week Ended'].apply(date_parser)
+    labour_df['Filed week ended'] = date_parser(labour_df['Filed week ended'])
+    labour_df['Reflecting Week Ended'] = date_parser(labour_df['Reflecting Week Ended'])
 
     # Calculate change in unemployment and newly employed
     labour_df['Total Claims'] = labour_df['Initial Claims'] + labour_df['Continued Claims']
     labour_df['Last Week Unemployed'] = labour_df['Total Claims'].shift(1)
-    labour_df['New_state'] = (labour_df['State'] != labour_df['State'].shift(1)).astype(int)
-    labour_df['Last Week Unemployed'] = labour_df.apply(lambda x: x['Total Claims'] if x['New_state'] == 1
-                                                        else x['Last Week Unemployed'], axis=1
-                                                    )
+    new_state = labour_df['State'] != labour_df['State'].shift(1)
+    labour_df['Last Week Unemployed'] = np.where(new_state,
+                                                 labour_df['Total Claims'], labour_df['Last Week Unemployed']
+                                                 )
     labour_df['Changed Unemployment'] = labour_df['Total Claims'] - labour_df['Last Week Unemployed']
 
     labour_df['Newly Employed'] = labour_df['Last Week Unemployed'] - labour_df['Continued Claims']
-    labour_df['Newly Employed'] = labour_df['Newly Employed'].apply(lambda x: max(0, x))
-
-    labour_df.drop(columns=['Last Week Unemployed', 'New_state'], inplace=True)
-
+    labour_df['Newly Employed'] = np.maximum(labour_df['Newly Employed'], 0)
+
+    labour_df.drop(columns=['Last Week Unemployed'], inplace=True)
+
+    # format columns correctly, before the daily extension so it is only done once per week
+    # counts are well within int32 range, even for the largest states
+    labour_df = labour_df.astype({
+                    'Initial Claims': 'int32',
+                    'Continued Claims': 'int32',
+                    'Total Claims': 'int32',
+                    'Covered Employment': 'int32',
+                    'Changed Unemployment': 'int32',
+                    'Newly Employed': 'int32',
+                    'Insured Unemployment Rate': 'float32'
+                    })
 
     # Extend weekly data to daily data
-    labour_df_ext = pd.DataFrame(np.repeat(labour_df.values,7,axis=0))
-    labour_df_ext.columns = labour_df.columns
+    labour_df_ext = labour_df.loc[labour_df.index.repeat(7)].reset_index(drop=True)
     labour_df_ext.sort_values(by=['State','Filed week ended'], inplace=True)
 
-    # format columns correctly
-    labour_df_ext[['Initial Claims', 'Continued Claims', 'Total Claims', 'Covered Employment', 'Changed Unemployment', 'Newly Employed']]\
-        =labour_df_ext[['Initial Claims', 'Continued Claims', 'Total Claims', 'Covered Employment', 'Changed Unemployment', 'Newly Employed']].astype(int)
-    labour_df_ext['Insured Unemployment Rate'] = labour_df_ext['Insured Unemployment Rate'].astype(float)
-
     # Calculate daily change and interpolated figures
-    labour_df_ext['New_state'] = (labour_df_ext['State'] != labour_df_ext['State'].shift(1)).astype(int)
-    labour_df_ext['Week_Offset'] = 6 - np.remainder(labour_df_ext.index.values,7)
-    labour_df_ext['Date'] = labour_df_ext.apply(lambda x: x['Reflecting Week Ended'] - timedelta(days=x['Week_Offset']), axis=1)
-
-    labour_df_ext.drop(columns=['New_state'], inplace=True)
+    # each week is now a sorted block of 7 days, counting down to the week end
+    labour_df_ext['Week_Offset'] = np.tile(np.arange(6, -1, -1, dtype=np.int8), len(labour_df))
+    labour_df_ext['Date'] = labour_df_ext['Reflecting Week Ended'] - \
+                            pd.to_timedelta(labour_df_ext['Week_Offset'], unit='D')
 
-    # map State to state_code for merge
+    # map State to state_code for merge, as categoricals so only the categories are mapped
     state_map, state_fip_map = get_fips_data()
+    labour_df_ext['State'] = labour_df_ext['State'].astype('category')
     labour_df_ext['state_code'] = labour_df_ext['State'].map(state_map)
 
     return labour_df_ext
@@ -176,8 +201,7 @@ def labour_county_transformation() -> pd.DataFrame:
     county_labour = county_labour.loc[county_labour['State FIPS Code']<=56]
 
     # Adjust for April 2020 results currently being preliminary, format and filter out pre 2020
-    county_labour['Period'] = county_labour['Period'].apply(lambda x: str(x)[:6])
-    county_labour['Period'] = pd.to_datetime(county_labour['Period'],format="%b-%y")
+    county_labour['Period'] = pd.to_datetime(county_labour['Period'].astype(str).str[:6],format="%b-%y")
     county_labour = county_labour.loc[county_labour['Period']>="2020-01-01"]
 
     # clean up the state information for merging
@@ -185,7 +209,7 @@ def labour_county_transformation() -> pd.DataFrame:
     county_labour['County FIPS Code'] = county_labour['County FIPS Code'].astype(int)
     county_labour['County Name'] = county_labour['County Name/State Abbreviation'].str.split(pat=",",expand=True).iloc[:,0]
     county_labour['State Code'] = county_labour['State FIPS Code'].map(state_fip_map)
-    county_labour['county_fip'] = county_labour['State FIPS Code'].astype(str) + county_labour['County FIPS Code'].astype(str).str.zfill(3)
+    county_labour['county_fip'] = county_labour['State FIPS Code'].astype(np.int64)*1000 + county_labour['County FIPS Code'].astype(np.int64)
 
     county_labour.drop(columns=['LAUS Code',
                             'County Name/State Abbreviation', 
@@ -201,16 +225,14 @@ def labour_county_transformation() -> pd.DataFrame:
     # Extend April data to May because the latter not yet available
     county_labour_may = county_labour.loc[county_labour['Period'].dt.month==4].copy()
     county_labour_may['Period'] = pd.to_datetime("2020-05-01")
-    county_labour = county_labour.append(county_labour_may,ignore_index=True)
-    county_labour.reset_index(drop=True,inplace=True)
+    county_labour = pd.concat([county_labour, county_labour_may], ignore_index=True)
 
     # Calculate county level contribution to state level unemployment
-    county_labour['County Contrib to State Unemployment'] = county_labour.groupby(['State Code','Period'])['Unemployed'].apply(lambda x:
-                                                                           x/x.sum()
-                                                                           )
+    state_unemployed = county_labour.groupby(['State Code','Period'])['Unemployed'].transform('sum')
+    county_labour['County Contrib to State Unemployment'] = county_labour['Unemployed'] / state_unemployed
 
     # format number columns
-    county_labour[['Labor Force','Employed','Unemployed','county_fip']] = county_labour[['Labor Force','Employed','Unemployed','county_fip']].astype(int)
+    county_labour[['Labor Force','Employed','Unemployed']] = county_labour[['Labor Force','Employed','Unemployed']].astype(int)
     county_labour[['Unemployment Rate (%)','County Contrib to State Unemployment']] = county_labour[['Unemployment Rate (%)','County Contrib to State Unemployment']].astype(float)
 
     return county_labour
@@ -229,11 +251,20 @@ def merge_state_county() -> pd.DataFrame:
     labour_df_ext = labour_state_transformation()
     county_labour = labour_county_transformation()
 
+    # Share one set of state categories so the merge joins on integer codes
+    state_dtype = pd.CategoricalDtype(union_categoricals([
+                        labour_df_ext['state_code'].astype('category'),
+                        county_labour['State Code'].astype('category')
+                    ], sort_categories=True).categories)
+    labour_df_ext['state_code'] = labour_df_ext['state_code'].astype(state_dtype)
+    county_labour['State Code'] = county_labour['State Code'].astype(state_dtype)
+
     # Merge two unemployment tables them on state_code
-    labour_combined = labour_df_ext.merge(county_labour, how='outer', left_on='state_code', right_on='State Code')
+    # unmapped states would otherwise be joined on their missing codes
+    county_labour = county_labour.dropna(subset=['State Code'])
+    labour_combined = labour_df_ext.merge(county_labour, how='inner', left_on='state_code', right_on='State Code')
 
     # Remove non-essential entries created by merge
-    labour_combined = labour_combined[~labour_combined['state_code'].isna()]
     labour_combined = labour_combined[(labour_combined['Date'].dt.month==labour_combined['Period'].dt.month)]
 
     # Calculate County level data from State level data
@@ -243,8 +274,7 @@ def merge_state_county() -> pd.DataFrame:
     labour_combined['County Changed Unemployment'] = labour_combined['Changed Unemployment']*labour_combined['County Contrib to State Unemployment']
 
     # Create the County daily values for the ABT
-    labour_combined['County_Daily_Unemployment_Change'] = labour_combined.groupby(['State','Reflecting Week Ended'])['County Changed Unemployment']\
-                                            .transform(lambda x: x / 7)
+    labour_combined['County_Daily_Unemployment_Change'] = labour_combined['County Changed Unemployment'] / 7
     labour_combined['County_Daily_Interp_Total_Claims'] = labour_combined['County Total Claims'] - \
                                         labour_combined['County_Daily_Unemployment_Change']*labour_combined['Week_Offset']
 
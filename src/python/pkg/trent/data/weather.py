@@ -4,13 +4,16 @@ from typing import NamedTuple, Union
 
 import numpy as np
 import pandas as pd
-import requests
+
+from trent.data import _http
 
 # ------- Constants ------- #
 # Equitorial radius of earth.
 # Source: https://en.wikipedia.org/wiki/Earth_radius#Equatorial_radius
 EARTH_RADIUS: float = 6378.137
 
+FloatOrArray = Union[int, float, np.ndarray]
+
 
 class BoundingBox(NamedTuple):
     minlat: float
@@ -57,10 +60,10 @@ def get_icao_data() -> pd.DataFrame:
         str,
         str,
     ]
-    r = requests.get(url)
+    r = _http.get_session().get(url)
     if r.ok:
         return pd.read_csv(
-            io.StringIO(r.content.decode(r.encoding)),
+            io.BytesIO(r.content),
             names=columns,
             dtype=dict(zip(columns, dtypes)),
             na_values="\\N",
@@ -79,57 +82,62 @@ def radian2degree(r: Union[int, float]) -> float:
     return r * 180 / np.pi
 
 
-def dist_btwn_points(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Compute great circle distance (km) between two lat/lon decimal degree pairs"""
-    global EARTH_RADIUS
-
-    lat1 = degree2radian(lat1)
-    lon1 = degree2radian(lon1)
-    lat2 = degree2radian(lat2)
-    lon2 = degree2radian(lon2)
-
-    return EARTH_RADIUS * np.arccos(
-        np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * np.cos(lat2) * np.cos(lon1 - lon2)
+def dist_btwn_points(
+    lat1: FloatOrArray, lon1: FloatOrArray, lat2: FloatOrArray, lon2: FloatOrArray
+) -> FloatOrArray:
+    """
+    Compute great circle distance (km) between lat/lon decimal degree pairs.
+    Inputs may be scalars or arrays, and are broadcast against each other.
+    """
+    lat1 = np.deg2rad(lat1)
+    lon1 = np.deg2rad(lon1)
+    lat2 = np.deg2rad(lat2)
+    lon2 = np.deg2rad(lon2)
+
+    # Haversine form; stays accurate for short distances, unlike the law of cosines
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
     )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
 
 
-def bounding_box(lat: float, lon: float, radius: Union[int, float]) -> BoundingBox:
+def bounding_box(
+    lat: FloatOrArray, lon: FloatOrArray, radius: FloatOrArray
+) -> BoundingBox:
     """
     Compute bounding box from lat/lon decimal degree point and radius.
     Bounding box is composed of minimum latitude, maximum latitude, minumum longitude,
-    and maximum longitude.
+    and maximum longitude. Array inputs give a bounding box of arrays.
     """
-    global EARTH_RADIUS
-
     global_min_lat = -np.pi / 2
     global_max_lat = np.pi / 2
     global_min_lon = -np.pi
     global_max_lon = np.pi
 
-    lat = degree2radian(lat)
-    lon = degree2radian(lon)
+    lat = np.deg2rad(lat)
+    lon = np.deg2rad(lon)
 
     # compute angular distance in radians
-    angular_dist = radius / EARTH_RADIUS
+    angular_dist = np.asarray(radius) / EARTH_RADIUS
 
     min_lat = lat - angular_dist
     max_lat = lat + angular_dist
 
-    if min_lat > global_min_lat & max_lat < global_max_lat:
-        delta_lon = np.arcsin(np.sin(angular_dist) / np.cos(lat))
-        min_lon = lon - delta_lon
-        max_lon = lon + delta_lon
-
-        if min_lon < global_min_lon:
-            min_lon = min_lon + 2 * np.pi
-
-        if max_lon > global_max_lon:
-            max_lon = max_lon - 2 * np.pi
+    # where a pole is within the search radius the longitude is unbounded
+    no_pole = (min_lat > global_min_lat) & (max_lat < global_max_lat)
 
-    else:  # a pole is within the search radius
-        min_lat = max(min_lat, global_min_lat)
-        max_lat = min(max_lat, global_max_lat)
-        min_lon = global_min_lon
-        max_lon = global_max_lon
-
-    return BoundingBox(minlat=min_lat, maxlat=max_lat, minlon=min_lon, maxlon=max_lon)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_lon = np.arcsin(np.sin(angular_dist) / np.cos(lat))
+    min_lon = lon - delta_lon
+    max_lon = lon + delta_lon
+    min_lon = np.where(min_lon < global_min_lon, min_lon + 2 * np.pi, min_lon)
+    max_lon = np.where(max_lon > global_max_lon, max_lon - 2 * np.pi, max_lon)
+
+    # [()] unwraps 0-d results so scalar inputs give scalar outputs
+    return BoundingBox(
+        minlat=np.where(no_pole, min_lat, np.maximum(min_lat, global_min_lat))[()],
+        maxlat=np.where(no_pole, max_lat, np.minimum(max_lat, global_max_lat))[()],
+        minlon=np.where(no_pole, min_lon, global_min_lon)[()],
+        maxlon=np.where(no_pole, max_lon, global_max_lon)[()],
+    )
@@ -1,57 +1,56 @@
+import copy
 import sys
 from pathlib import Path
 
 import torch
-import torch.nn as nn
 
 from trent.abt import torch_data as td
 from trent.models.dual_loss_regression import (
     Dual_Loss_Regression,
     call_device,
     model_exec,
+    model_exec_ddp,
+    model_solve,
 )
 
-torch.manual_seed(0)
-
 # paths for packages
 loader_path = Path(__file__).resolve().parents[2]
 sys.path.append(loader_path)
 
+# The data, device and model are set up under __main__ below, so DDP's
+# spawned workers can import this module without reloading the ABT
+SRCFILE = "/Users/carl/Documents/code_repos/emer2gent-covid19/carl_data/model_abt.csv"
+
+# path to save checkpoints to, for repeat i and fold k
+PATH_WEIGHTS = str(Path(
+    "/Users/carl/Documents/code_repos",
+    "emer2gent-covid19/carl/model_weights/torch_weights_rpt_{i}_fold_{k}.pth",
+))
+
 # calling gpu recources if available
 use_cuda_if_available = True
 parallelize_if_possible = False
-device = call_device(use_cuda_if_available, parallelize_if_possible)
+
+# Training decisions
+# "closed_form" solves the weighted ridge exactly, "sgd" or "lbfgs" train iteratively
+# with parallelize_if_possible, "sgd" trains on every GPU via DDP
+solver = "closed_form"
 
 # dataloader decisions
 REPEAT = 10
 FOLDS = 5
-BATCH_SIZE = 512
-
-# create the data loader
-orchestrator = td.RepeatedStratifiedGroupKFoldOrchestrator(
-    "/Users/carl/Documents/code_repos/emer2gent-covid19/carl_data/model_abt.csv",
-    repeats=REPEAT,
-    folds=FOLDS,
-    batch_size=BATCH_SIZE
-    )
-
+# None loads each fold as one batch, which suits the closed form and LBFGS's
+# full-batch steps; sgd keeps minibatches so each epoch takes many steps
+BATCH_SIZE = 512 if solver == "sgd" else None
 
 # initilise the model
 num_features = 17
 num_loss = 2
 
-# create the model
-model = Dual_Loss_Regression(num_features, num_loss)
-
-# initialize weights for the model
-def weights_init(m):
-    if type(m) == nn.Linear:
-        torch.nn.init.xavier_uniform_(m.weight)
-        m.bias.data.fill_(0.01)
-
-# Training decisions
-learning_rate = 1e-2
-num_epochs = 10
+# sgd only; steps on the mean loss of 512-row batches, so this gives the same
+# updates as 1e-2 did on their summed loss
+learning_rate = 5.12
+num_epochs = 10  # sgd and lbfgs only
 
 health_weight = 1
 econ_weight = 1
@@ -60,35 +59,73 @@ l2_lambda = 0.000001
 save_model = False
 
 
-def execute():
+# initialize weights for the model
+def weights_init(m):
+    if isinstance(m, Dual_Loss_Regression):
+        torch.nn.init.xavier_uniform_(m.weight)
+        if m.bias is not None:
+            m.bias.data.fill_(0.01)
+
+
+def execute(orchestrator, model, device):
+
+    if solver == "sgd" and parallelize_if_possible and torch.cuda.device_count() > 1:
+        # One set of GPU workers trains every fold
+        states = model_exec_ddp(
+            model,
+            orchestrator,
+            health_weight,
+            econ_weight,
+            learning_rate,
+            num_epochs,  # or do till convergance
+            l2_lambda,
+            save_model,
+            PATH_WEIGHTS,
+        )
+        return {
+            i: {k: state["weight"].numpy() for k, state in fold_states.items()}
+            for i, fold_states in states.items()
+        }
+
+    # every fold restarts from a copy of the initial weights
+    initial_state = copy.deepcopy(model.state_dict())
 
     repeat_dict = {}
     for i, repeat in enumerate(orchestrator): # each repetition of cv
         fold_dict = {}
         for k, (tr, te) in enumerate(repeat): # each fold within a cv iteration
             print(f'Repeat: {i}, Fold: {k}')
-            run_iter = f'rpt_{i}_fold_{k}'
-            # path to save checkpoints to
-            path_weights = Path(
-                "/Users/carl/Documents/code_repos",
-                f"emer2gent-covid19/carl/model_weights/torch_weights_{run_iter}.pth",
-            )
-            model.apply(weights_init)
-            coeffs_ = model_exec(
-                model,
-                device,
-                tr,  # X,y,z
-                te,
-                health_weight,
-                econ_weight,
-                learning_rate,
-                num_epochs,  # or do till convergance
-                l2_lambda,
-                save_model,
-                path_weights
-            )
-
-            fold_dict[k] = coeffs_.detach().numpy()
+            path_weights = Path(PATH_WEIGHTS.format(i=i, k=k))
+            model.load_state_dict(initial_state)
+            if solver == "closed_form":
+                coeffs_ = model_solve(
+                    model,
+                    device,
+                    tr,  # X,y,z
+                    te,
+                    health_weight,
+                    econ_weight,
+                    l2_lambda,
+                    save_model,
+                    path_weights
+                )
+            else:
+                coeffs_ = model_exec(
+                    model,
+                    device,
+                    tr,  # X,y,z
+                    te,
+                    health_weight,
+                    econ_weight,
+                    learning_rate,
+                    num_epochs,  # or do till convergance
+                    l2_lambda,
+                    save_model,
+                    path_weights,
+                    optimiser_type=solver,
+                )
+
+            fold_dict[k] = coeffs_.detach().cpu().numpy()
         
         repeat_dict[i] = fold_dict
 
@@ -97,4 +134,21 @@ def execute():
 
 
 if __name__ == "__main__":
-    execute()
+    torch.manual_seed(0)
+
+    device = call_device(use_cuda_if_available, parallelize_if_possible)
+
+    # create the data loader
+    orchestrator = td.RepeatedStratifiedGroupKFoldOrchestrator(
+        SRCFILE,
+        repeats=REPEAT,
+        folds=FOLDS,
+        batch_size=BATCH_SIZE,
+        pin_memory=device.type == "cuda",
+        )
+
+    # create the model, initialised once
+    model = Dual_Loss_Regression(num_features, num_loss)
+    model.apply(weights_init)
+
+    execute(orchestrator, model, device)
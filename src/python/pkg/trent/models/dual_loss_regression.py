@@ -1,51 +1,104 @@
 """ """
+import copy
+import math
+import socket
+
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.nn as nn
+import torch.nn.functional as F
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
 
 class Dual_Loss_Regression(nn.Module):
-    def __init__(self, num_features, num_loss):
+    def __init__(self, num_features, num_loss, bias=True):
 
         super(Dual_Loss_Regression, self).__init__()
 
         self.num_features = num_features
         self.num_loss = num_loss
 
-        # Define the network
-        self.layer_1 = nn.Linear(self.num_features, self.num_loss)
+        # Define the network: one linear map, with the bias optional for
+        # features that already carry an intercept column
+        self.weight = nn.Parameter(torch.empty(self.num_loss, self.num_features))
+        if bias:
+            self.bias = nn.Parameter(torch.empty(self.num_loss))
+        else:
+            self.register_parameter("bias", None)
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        # Same default initialisation as nn.Linear
+        nn.init.kaiming_uniform_(self.weight, a=math.sqrt(5))
+        if self.bias is not None:
+            bound = 1 / math.sqrt(self.num_features)
+            nn.init.uniform_(self.bias, -bound, bound)
 
     def forward(self, x):
-        x = self.layer_1(x)
-        return x
+        return F.linear(x, self.weight, self.bias)
 
 
 def call_device(use_cuda_if_available=True, parallelize_if_possible=False):
+    """Pick the training device, reporting how many GPUs training will use.
 
+    Multi-GPU training doesn't go through this device: model_exec_ddp starts
+    one process per GPU, each on its own device.
+    """
     device = torch.device("cpu")
-    if use_cuda_if_available:
+    if use_cuda_if_available and torch.cuda.is_available():
+        device = torch.device("cuda:0")
 
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    if device.type == "cuda":
+        print("Device used for training: GPU")
+    else:
+        print("Device used for training: CPU")
 
-        if str(device) == "cuda:0":
-            device_used_for_training = "GPU"
-        else:
-            device_used_for_training = "CPU"
+    if device.type != "cuda":
+        print("Number of GPUs used: " + str(0))
+    elif parallelize_if_possible and torch.cuda.device_count() > 1:
+        print("Number of GPUs used: " + str(torch.cuda.device_count()))
+    else:
+        print("Number of GPUs used: " + str(1))
 
-    print("Device used for training: " + device_used_for_training)
+    return device
 
-    if (
-        str(device) == "cuda:0"
-        and parallelize_if_possible
-        and torch.cuda.device_count() > 1
-    ):
-        print("Number of GPUs used: " + str(torch.cuda.device_count()))
 
-    elif str(device) == "cuda:0":
-        print("Number of GPUs used: " + str(1))
+def _stack_loader(data_loader, device):
+    """Concatenate all (x, y, z) batches of a loader into tensors on device.
 
-    else:
-        print("Number of GPUs used: " + str(0))
+    torch.cat returns pageable memory, so for a GPU the result is pinned to
+    keep the copy asynchronous; a single (full) batch is used as it is.
+    """
+    stacked = []
+    for t in zip(*data_loader):
+        t = t[0] if len(t) == 1 else torch.cat(t)
+        if device.type == "cuda" and not t.is_pinned():
+            t = t.pin_memory()
+        stacked.append(t.to(device, non_blocking=True))
+    return tuple(stacked)
 
-    return device
+
+def _amp_dtype(device):
+    """Autocast dtype for device: bfloat16 where the GPU supports it, else float16.
+
+    bfloat16 keeps float32's exponent range, so large squared residuals can't
+    overflow and no loss scaling is needed.
+    """
+    if device.type == "cuda" and torch.cuda.is_bf16_supported():
+        return torch.bfloat16
+    return torch.float16
+
+
+def _dual_loss(outputs, y, z, loss_weights):
+    """Sum of z-weighted squared errors, each output scaled by its loss weight.
+
+    Equivalent to weighting and adding the per-output MSELoss(reduction="none")
+    sums, in one pass over the (n, 2) residuals.
+    """
+    diff = outputs - y
+    return (diff * diff).mul_(z.unsqueeze(1)).mul_(loss_weights).sum()
 
 
 def model_exec(
@@ -61,59 +114,110 @@ def model_exec(
     save_model,
     path_weights,
     verbose=False,
+    optimiser_type="sgd",
+    rank=0,
 ):
-    optimiser = torch.optim.SGD(
-        model.parameters(), lr=learning_rate, weight_decay=l2_lambda
-    )
+    """Train the model by minibatch SGD, or full-batch L-BFGS.
+
+    SGD steps on each batch's mean loss, with weight_decay scaled to match, so
+    it minimises the same objective as model_solve divided by the number of
+    training rows, and learning_rate doesn't depend on the batch size.
+
+    optimiser_type "lbfgs" suits this convex problem: each epoch is one
+    L-BFGS step of up to 20 iterations over the whole fold, with the same
+    l2_lambda / 2 penalty that SGD's weight_decay implies added to the loss.
+
+    rank is set by model_exec_ddp for a DDP-wrapped model; only rank 0
+    validates, reports and saves.
+    """
     model.to(device)
 
-    for e in range(num_epochs):
+    # Under DDP the parameters live on the wrapped module
+    module = getattr(model, "module", model)
+    if optimiser_type == "lbfgs":
+        optimiser = torch.optim.LBFGS(
+            model.parameters(),
+            lr=1,
+            max_iter=20,
+            history_size=10,
+            line_search_fn="strong_wolfe",
+        )
+    else:
+        # The decay is applied per step to mean-loss gradients, so it is
+        # scaled by the number of rows in the fold (over all ranks)
+        n_rows = len(data_loader.dataset)
+        optimiser = torch.optim.SGD(
+            model.parameters(), lr=learning_rate, weight_decay=l2_lambda / n_rows
+        )
+
+    # Mixed precision on GPU; the scaler keeps fp16 gradients from underflowing,
+    # and is not needed for bf16. LBFGS's closure runs in full precision
+    use_amp = device.type == "cuda" and optimiser_type != "lbfgs"
+    amp_dtype = _amp_dtype(device)
+    scaler = torch.cuda.amp.GradScaler(
+        enabled=use_amp and amp_dtype == torch.float16
+    )
 
-        loss_tot = 0
+    # The folds are small, so move each to the device once and slice batches from it
+    x_all, y_all, z_all = _stack_loader(data_loader, device)
+    batch_size = data_loader.batch_size
 
-        for i, (x, y, z) in enumerate(data_loader):
+    # Check for missing values once per fold, rather than syncing on every batch
+    for name, t in (("x", x_all), ("y", y_all), ("z", z_all)):
+        if torch.isnan(t).any(): print(f'{name} has nan')
 
-            model.train()
-            model.zero_grad()
-            optimiser.zero_grad()
+    loss_weights = torch.tensor([health_weight, econ_weight], device=device)
 
-            if torch.isnan(x).sum() > 0: print(f'x has nan')
-            if torch.isnan(y).sum() > 0: print(f'y has nan')
-            if torch.isnan(z).sum() > 0: print(f'z has nan')
+    def forward_loss(x, y, z):
+        return _dual_loss(model(x), y, z, loss_weights)
 
-            x = x.to(device)
-            y = y.to(device)
-            z = z.to(device)
+    # Fuse the forward pass and loss into a single kernel where torch.compile
+    # exists (torch 2.x); on the pinned torch this is skipped
+    if hasattr(torch, "compile"):
+        forward_loss = torch.compile(forward_loss)
 
-            outputs = model(x)
+    def closure():
+        optimiser.zero_grad(set_to_none=True)
+        loss = forward_loss(x_all, y_all, z_all)
+        loss = loss + l2_lambda / 2 * sum(p.pow(2).sum() for p in model.parameters())
+        loss.backward()
+        return loss
 
-            health_pred = outputs[:, 0]
-            econ_pred = outputs[:, 1]
+    for e in range(num_epochs):
 
-            health_targ = y[:, 0]
-            econ_targ = y[:, 1]
+        # val_part leaves the model in eval mode, so set train mode per epoch
+        model.train()
+
+        if optimiser_type == "lbfgs":
+            loss_tot = optimiser.step(closure).item()
+        else:
+            # Accumulate on the device and sync once per epoch
+            loss_tot_t = torch.zeros((), device=device)
 
-            loss_func = nn.MSELoss(reduction="none")
+            for start in range(0, x_all.shape[0], batch_size):
 
-            health_loss = loss_func(health_pred, health_targ) * z
-            health_loss = health_loss.sum()
+                x = x_all[start:start + batch_size]
+                y = y_all[start:start + batch_size]
+                z = z_all[start:start + batch_size]
 
-            econ_loss = loss_func(econ_pred, econ_targ) * z
-            econ_loss = econ_loss.sum()
+                optimiser.zero_grad(set_to_none=True)
 
-            # Sum all loss functions for final result
-            loss = health_weight * health_loss + econ_weight * econ_loss
+                with torch.autocast("cuda", dtype=amp_dtype, enabled=use_amp):
+                    loss = forward_loss(x, y, z)
 
-            loss.backward()
-            optimiser.step()
+                # Step on the batch mean; under DDP, averaging the ranks'
+                # gradients makes it the mean over the global batch
+                scaler.scale(loss / x.shape[0]).backward()
+                scaler.step(optimiser)
+                scaler.update()
 
-            loss_batch = loss.item()
+                loss_tot_t.add_(loss.detach())
 
-            loss_tot += loss.item()
+            loss_tot = loss_tot_t.item()
 
-        if e % 2 == 0 and verbose:
+        if e % 2 == 0 and verbose and rank == 0:
             val_loss = val_part(
-                                model,
+                                module,
                                 device,
                                 data_loader_val,
                                 health_weight,
@@ -125,6 +229,213 @@ def model_exec(
             print(f"Val_loss: {val_loss}")
           
         
+    if rank == 0:
+        val_loss = val_part(
+            module,
+            device,
+            data_loader_val,
+            health_weight,
+            econ_weight,
+            save_model,
+            path_weights,
+            )  
+        print(f"Train_Loss: {loss_tot}")
+        print(f"Val_loss: {val_loss}")
+
+        if save_model: torch.save(module.state_dict(), path_weights)
+
+    coeffs_run = module.weight.clone()
+
+    return coeffs_run
+
+
+def _free_port():
+    """An unused local TCP port for the process group to rendezvous on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _train_worker(
+    rank,
+    world_size,
+    init_method,
+    model,
+    cv,
+    states_out,
+    health_weight,
+    econ_weight,
+    learning_rate,
+    num_epochs,
+    l2_lambda,
+    save_model,
+    path_weights,
+    verbose,
+):
+    """Train one DDP replica on GPU rank for every fold of cv.
+
+    Each rank iterates its own copy of cv, so it must yield the same folds in
+    every process. Gradients are averaged across replicas on every backward
+    pass, so all ranks finish each fold with the same parameters; rank 0
+    reports, saves and copies them into the shared states_out tensors.
+    """
+    dist.init_process_group(
+        "nccl", init_method=init_method, rank=rank, world_size=world_size
+    )
+    torch.cuda.set_device(rank)
+    device = torch.device("cuda", rank)
+
+    try:
+        for i, repeat in enumerate(cv):
+            for k, (tr, te) in enumerate(repeat):
+                # Every fold starts from the caller's initial parameters
+                ddp_model = DDP(copy.deepcopy(model).to(device), device_ids=[rank])
+
+                sampler = DistributedSampler(
+                    tr.dataset, num_replicas=world_size, rank=rank, shuffle=True
+                )
+                data_loader = DataLoader(
+                    tr.dataset, batch_size=tr.batch_size, sampler=sampler,
+                    pin_memory=True,
+                )
+                data_loader_val = DataLoader(
+                    te.dataset, batch_size=te.batch_size, pin_memory=True
+                )
+
+                model_exec(
+                    ddp_model,
+                    device,
+                    data_loader,
+                    data_loader_val,
+                    health_weight,
+                    econ_weight,
+                    learning_rate,
+                    num_epochs,
+                    l2_lambda,
+                    save_model,
+                    path_weights.format(i=i, k=k),
+                    verbose=verbose,
+                    rank=rank,
+                )
+                if rank == 0:
+                    for name, t in ddp_model.module.state_dict().items():
+                        states_out[i][k][name].copy_(t)
+    finally:
+        dist.destroy_process_group()
+
+
+def model_exec_ddp(
+    model,
+    cv,  # repeats of (train, val) loaders of X,y,z
+    health_weight,
+    econ_weight,
+    learning_rate,
+    num_epochs,  # or do till convergance
+    l2_lambda,
+    save_model,
+    path_weights,
+    verbose=False,
+    world_size=None,
+):
+    """Train the model on every CV fold by minibatch SGD with DDP.
+
+    Spawns one process per GPU (all visible GPUs by default) once for the
+    whole run, rather than per fold. cv is a RepeatedStratifiedGroupKFold-
+    Orchestrator (anything with repeats and folds that iterates the same way
+    in every process); each rank trains on DistributedSampler shards of its
+    folds, starting each fold from model's parameters. path_weights is
+    formatted with the repeat i and fold k. Only SGD is supported: LBFGS's
+    line search needs the full-data loss on every rank. Call from under an
+    `if __name__ == "__main__":` guard, since the workers are started with spawn.
+
+    Returns:
+        dict[int, dict[int, dict]]: trained state_dict per repeat and fold
+    """
+    if world_size is None:
+        world_size = torch.cuda.device_count()
+
+    # Rank 0 writes each fold's trained parameters here; shared memory
+    # survives spawn
+    model = model.cpu()
+    states_out = {
+        i: {
+            k: {
+                name: torch.empty_like(t).share_memory_()
+                for name, t in model.state_dict().items()
+            }
+            for k in range(cv.folds)
+        }
+        for i in range(cv.repeats)
+    }
+
+    mp.spawn(
+        _train_worker,
+        args=(
+            world_size,
+            f"tcp://127.0.0.1:{_free_port()}",
+            model,
+            cv,
+            states_out,
+            health_weight,
+            econ_weight,
+            learning_rate,
+            num_epochs,
+            l2_lambda,
+            save_model,
+            str(path_weights),
+            verbose,
+        ),
+        nprocs=world_size,
+    )
+
+    return states_out
+
+
+def model_solve(
+    model,
+    device,
+    data_loader,  # X,y,z
+    data_loader_val,
+    health_weight,
+    econ_weight,
+    l2_lambda,
+    save_model,
+    path_weights,
+):
+    """Fit the model in closed form as a weighted ridge regression.
+
+    Each output k minimises its loss weight times the z-weighted squared
+    error, plus the l2_lambda / 2 penalty on weight and bias that SGD's
+    weight_decay applies in model_exec. So it solves
+    (w_k X'ZX + l2_lambda / 2 I) b_k = w_k X'Z y_k, with X holding a column
+    of ones for the bias when the model has one. A zero loss weight gives
+    zero coefficients for that output.
+    """
+    model.to(device)
+
+    # Stack the batches once, in double precision for the solve
+    x, y, z = (t.double() for t in _stack_loader(data_loader, device))
+    if model.bias is not None:
+        ones = torch.ones(x.shape[0], 1, dtype=x.dtype, device=device)
+        x = torch.cat([x, ones], dim=1)
+
+    xtz = x.t() * z
+    gram = xtz @ x
+    moments = xtz @ y
+
+    # One batched solve covers both outputs; the loss weights scale the data
+    # terms rather than dividing the penalty, so a zero weight stays finite
+    w = torch.tensor([health_weight, econ_weight], dtype=x.dtype, device=device)
+    eye = torch.eye(x.shape[1], dtype=x.dtype, device=device)
+    lhs = w[:, None, None] * gram + l2_lambda / 2 * eye
+    rhs = w[:, None] * moments.t()
+    coeffs = torch.linalg.solve(lhs, rhs.unsqueeze(-1)).squeeze(-1)
+
+    with torch.no_grad():
+        model.weight.copy_(coeffs[:, :model.num_features])
+        if model.bias is not None:
+            model.bias.copy_(coeffs[:, -1])
+
     val_loss = val_part(
         model,
         device,
@@ -133,13 +444,12 @@ def model_exec(
         econ_weight,
         save_model,
         path_weights,
-        )  
-    print(f"Train_Loss: {loss_tot}")
+        )
     print(f"Val_loss: {val_loss}")
 
     if save_model: torch.save(model.state_dict(), path_weights)
 
-    coeffs_run = model.layer_1.weight.clone()
+    coeffs_run = model.weight.clone()
 
     return coeffs_run
 
@@ -158,33 +468,24 @@ def val_part(
     model = model.to(device)
     model.eval()
 
-    loss_tot = 0
-
-    for i, (x, y, z) in enumerate(data_loader):
-
-        x = x.to(device)
-        y = y.to(device)
-        z = z.to(device)
+    use_amp = device.type == "cuda"
+    amp_dtype = _amp_dtype(device)
+    loss_weights = torch.tensor([health_weight, econ_weight], device=device)
 
-        outputs = model(x)
+    loss_tot_t = torch.zeros((), device=device)
 
-        health_pred = outputs[:, 0]
-        econ_pred = outputs[:, 1]
-
-        health_targ = y[:, 0]
-        econ_targ = y[:, 1]
-
-        loss_func = nn.MSELoss(reduction="none")
-
-        health_loss = loss_func(health_pred, health_targ) * z
-        health_loss = health_loss.sum()
+    for i, (x, y, z) in enumerate(data_loader):
 
-        econ_loss = loss_func(econ_pred, econ_targ) * z
-        econ_loss = econ_loss.sum()
+        x = x.to(device, non_blocking=True)
+        y = y.to(device, non_blocking=True)
+        z = z.to(device, non_blocking=True)
 
-        # Sum all loss functions for final result
-        loss = health_weight * health_loss + econ_weight * econ_loss
+        with torch.inference_mode(), torch.autocast(
+            "cuda", dtype=amp_dtype, enabled=use_amp
+        ):
+            outputs = model(x)
+            loss = _dual_loss(outputs, y, z, loss_weights)
 
-        loss_tot += loss.item()
+        loss_tot_t.add_(loss)
 
-    return loss_tot
+    return loss_tot_t.item()
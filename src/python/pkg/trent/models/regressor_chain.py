@@ -6,8 +6,7 @@ from trent.abt import sklearn_cv_data as cv_data
 import numpy as np
 import pandas as pd
 
-from sklearn.multioutput import RegressorChain
-from sklearn.linear_model import Ridge
+from joblib import Parallel, delayed
 from sklearn.metrics import mean_squared_error
 
 import matplotlib.pyplot as plt
@@ -17,37 +16,86 @@ import seaborn as sns
 loader_path = Path(__file__).resolve().parents[2]
 sys.path.append(loader_path)
 
+
+def _moments(X, y):
+    """Sufficient statistics of a ridge fit: row count, sums, X'X and X'y."""
+    return [X.shape[0], X.sum(axis=0), y.sum(axis=0), X.T @ X, X.T @ y]
+
+
+def _add_moments(a, b):
+    """Moments of the rows in both a and b."""
+    return [m + n for m, n in zip(a, b)]
+
+
+def _sub_moments(a, b):
+    """Moments of the rows in a but not in b."""
+    return [m - n for m, n in zip(a, b)]
+
+
+def _chain_moments(moments, X, link, y, target):
+    """Moments for predicting y[:, target] from X plus a chained `link` column.
+
+    Only the new border of X'X is computed; the X'X block is reused.
+    """
+    n, sx, sy, xtx, xty = moments
+    xl = X.T @ link
+    return [
+        n,
+        np.append(sx, link.sum()),
+        sy[[target]],
+        np.block([[xtx, xl[:, None]], [xl[None, :], np.array([[link @ link]])]]),
+        np.vstack([xty[:, [target]], [[link @ y[:, target]]]]),
+    ]
+
+
+def _ridge_solve(moments, alpha):
+    """Coefficients (targets x features) and intercepts of sklearn's Ridge.
+
+    The intercept is unpenalised, so the solve is on the centred moments.
+    """
+    n, sx, sy, xtx, xty = moments
+    mx, my = sx / n, sy / n
+    gram = xtx - n * np.outer(mx, mx)
+    cross = xty - n * np.outer(mx, my)
+    coef = np.linalg.solve(gram + alpha * np.eye(len(mx)), cross).T
+    return coef, my - coef @ mx
+
+
+def _ridge_predict(X, coef, intercept):
+    """Predictions, one column per target."""
+    return X @ coef.T + intercept
+
  
 class Regressor_Chain():
 
         def __init__(
-        self, srcfile: str, folds: int = 5, repeats: int = 1, seed: int = 0, l2_lambda: float = 0.001, verbose: bool=False
+        self, srcfile: str, folds: int = 5, repeats: int = 1, seed: int = 0, l2_lambda: float = 0.001, verbose: bool=False,
+        n_jobs: int = -1
         ):
             """Initialize the orchestrator.
 
             Args:
-                srcfile (str): path to the ABT CSV
+                srcfile (str): path to the ABT CSV or Parquet file
                 folds (int): number of CV folds per repeat
                 repeats (int): number of repeats, shuffling each time
                 batch_size (int): eventual torch dataloader batch size
+                n_jobs (int): number of folds to fit in parallel, -1 for all cores
             """
             # Load the data
-            self.data = pd.read_csv(srcfile)
+            self.data = cv_data.read_abt(srcfile)
             self.folds = folds
             self.repeats = repeats
             self.seed = seed
             self.l2_lambda = l2_lambda
             self.verbose = verbose
-
-            # create the model
-            self.model = Ridge(alpha=self.l2_lambda, random_state=self.seed)
+            self.n_jobs = n_jobs
 
             # set seed
             np.random.seed(self.seed)
 
-            # data loader initialisation
+            # data loader initialisation, sharing the ABT loaded above
             self.orchestrator = orchestrator = cv_data.RepeatedStratifiedGroupKFoldOrchestrator(
-                "/Users/carl/Documents/code_repos/emer2gent-covid19/data/model_abt.csv", # TODO: need to update for final ABT location
+                data=self.data,
                 repeats=self.repeats,
                 folds=self.folds,
                 )
@@ -58,65 +106,113 @@ class Regressor_Chain():
         # run model for data above:
         def execute(self):
 
-            health_first_repeat_dict = {}
-            econ_first_repeat_dict = {}
-            for i, repeat in enumerate(self.orchestrator): # each repetition of cv
-                health_first_fold_dict = {}
-                econ_first_fold_dict = {}
-                for k, (tr, te) in enumerate(repeat): # each fold within a cv iteration
-                    
-                    X_train = tr[0][0]
-                    y_train = tr[0][1]
-                    z_train = tr[0][2]
-
-                    X_val = te[0][0]
-                    y_val = te[0][1]
-                    z_val = te[0][2]
-
-                    run_iter = f'rpt_{i}_fold_{k}'
-                    # path to save checkpoints to
-
-                    # econ model adjusted for health model
-                    r_chain_1 = RegressorChain(
-                                        self.model, 
-                                        order=[0,1],
-                                        cv=5,
-                                        random_state=self.seed
-                                        )
-
-                    r_chain_1.fit(X_train, y_train)
-                    y_pred = r_chain_1.predict(X_val)
-                    score_1 = mean_squared_error(y_val, y_pred, sample_weight=z_val)
-                    models = r_chain_1.estimators_
-                    health_model_1 = models[0]
-                    econ_model_1 = models[1]
-                    
-
-                    # econ model adjusted for health model
-                    r_chain_2 = RegressorChain(
-                                        self.model, 
-                                        order=[1,0],
-                                        cv=5,
-                                        random_state=self.seed
-                                        )
-                    r_chain_2.fit(X_train, y_train)
-                    y_pred = r_chain_2.predict(X_val)
-                    score_2 = mean_squared_error(y_val, y_pred, sample_weight=z_val)
-                    models = r_chain_2.estimators_
-                    health_model_2 = models[1]
-                    econ_model_2 = models[0]
-
-                    if self.verbose: print(f'Repeat: {i}, Fold: {k}, Validation Results: Model_1: {score_1}, Model_2: {score_2}')
-                    
-                    health_first_fold_dict[k] = [health_model_1.coef_, econ_model_1.coef_]
-                    econ_first_fold_dict[k] = [health_model_2.coef_, econ_model_2.coef_]
-
-                
-                health_first_repeat_dict[i] = health_first_fold_dict
-                econ_first_repeat_dict[i] = econ_first_fold_dict
+            def fold_tasks():
+                for i, repeat in enumerate(self.orchestrator): # each repetition of cv
+                    full_moments = None
+                    for k, (tr, te) in enumerate(repeat): # each fold within a cv iteration
+                        # Every fold of a repeat splits the same rows, so take X'X (and
+                        # friends) over all of them once, for each fold to downdate.
+                        # Features are shifted by a fixed offset first, which leaves
+                        # the ridge fits unchanged but keeps the moments well conditioned.
+                        if full_moments is None:
+                            shift = tr[0][0].mean(axis=0)
+                            full_moments = _add_moments(
+                                            _moments(tr[0][0] - shift, tr[0][1]),
+                                            _moments(te[0][0] - shift, te[0][1])
+                                            )
+                        yield delayed(self._run_fold)(i, k, tr, te, shift, full_moments)
+
+            # The folds are independent and numpy's solves release the GIL, so
+            # threads avoid copying each fold's data out to worker processes
+            results = Parallel(n_jobs=self.n_jobs, prefer="threads")(fold_tasks())
+
+            health_first_repeat_dict = {i: {} for i in range(self.repeats)}
+            econ_first_repeat_dict = {i: {} for i in range(self.repeats)}
+            for i, k, health_first, econ_first in results:
+                health_first_repeat_dict[i][k] = health_first
+                econ_first_repeat_dict[i][k] = econ_first
 
             return health_first_repeat_dict, econ_first_repeat_dict
 
+        def _run_fold(self, i, k, tr, te, shift, full_moments):
+            """Fit both chain orders on one fold, returning their coefficients."""
+
+            X_train = tr[0][0]
+            y_train = tr[0][1]
+            z_train = tr[0][2]
+
+            X_val = te[0][0]
+            y_val = te[0][1]
+            z_val = te[0][2]
+
+            run_iter = f'rpt_{i}_fold_{k}'
+            # path to save checkpoints to
+
+            X_train = X_train - shift
+            X_val = X_val - shift
+
+            # remove this fold's held-out rows from the repeat's moments
+            train_moments = _sub_moments(full_moments, _moments(X_val, y_val))
+
+            # The first link of each chain is a plain ridge per target. The
+            # chain features are out-of-fold predictions over the same
+            # unshuffled 5-fold split RegressorChain(cv=5) uses.
+            first_coef, first_intercept = _ridge_solve(train_moments, self.l2_lambda)
+            y_val_first = _ridge_predict(X_val, first_coef, first_intercept)
+
+            y_train_oof = np.empty_like(y_train)
+            for idx in np.array_split(np.arange(X_train.shape[0]), 5):
+                oof_moments = _sub_moments(train_moments, _moments(X_train[idx], y_train[idx]))
+                y_train_oof[idx] = _ridge_predict(X_train[idx], *_ridge_solve(oof_moments, self.l2_lambda))
+
+            # econ model adjusted for health model
+            econ_coef_1, econ_intercept_1 = _ridge_solve(
+                                _chain_moments(train_moments, X_train, y_train_oof[:, 0], y_train, 1),
+                                self.l2_lambda
+                                )
+            y_pred = np.column_stack([
+                                y_val_first[:, 0],
+                                _ridge_predict(np.column_stack([X_val, y_val_first[:, 0]]),
+                                               econ_coef_1, econ_intercept_1)[:, 0]
+                                ])
+            score_1 = mean_squared_error(y_val, y_pred, sample_weight=z_val)
+            health_coef_1 = first_coef[0]
+            econ_coef_1 = econ_coef_1[0]
+
+            # health model adjusted for econ model
+            health_coef_2, health_intercept_2 = _ridge_solve(
+                                _chain_moments(train_moments, X_train, y_train_oof[:, 1], y_train, 0),
+                                self.l2_lambda
+                                )
+            y_pred = np.column_stack([
+                                _ridge_predict(np.column_stack([X_val, y_val_first[:, 1]]),
+                                               health_coef_2, health_intercept_2)[:, 0],
+                                y_val_first[:, 1]
+                                ])
+            score_2 = mean_squared_error(y_val, y_pred, sample_weight=z_val)
+            health_coef_2 = health_coef_2[0]
+            econ_coef_2 = first_coef[1]
+
+            if self.verbose: print(f'Repeat: {i}, Fold: {k}, Validation Results: Model_1: {score_1}, Model_2: {score_2}')
+
+            return i, k, [health_coef_1, econ_coef_1], [health_coef_2, econ_coef_2]
+
+        def _stack_coeffs(self, repeat_dict):
+            """Gather each run's health and econ feature coefficients into arrays.
+
+            Runs are rows, in repeat then fold order. Only the feature coefficients
+            are kept, dropping the chained model's other-target coefficient.
+            """
+            health_coeffs = np.empty((self.repeats * self.folds, self.num_features))
+            econ_coeffs = np.empty_like(health_coeffs)
+            for i in range(self.repeats):
+                for j in range(self.folds):
+                    health_coef, econ_coef = repeat_dict[i][j]
+                    health_coeffs[i * self.folds + j] = health_coef[:self.num_features]
+                    econ_coeffs[i * self.folds + j] = econ_coef[:self.num_features]
+
+            return health_coeffs, econ_coeffs
+
         def graph_builder(
                         self, 
                         health_first_repeat_dict, 
@@ -134,10 +230,7 @@ class Regressor_Chain():
             # MODEL 1:
             if plot == 1 or plot == 2:
                 # select the health first model and format the coeffs for use in graphs
-                health_first_coeffs = [health_first_repeat_dict[i][j] for i in range(self.repeats) for j in range(self.folds)]
-                health_coeffs_1 = np.array([item[0] for item in health_first_coeffs])
-                econ_coeffs_1 = np.array([item[1] for item in health_first_coeffs])
-                econ_coeffs_1 = econ_coeffs_1[:,:self.num_features] # want only the feature coefficients, ignores the other target dependent coeff 
+                health_coeffs_1, econ_coeffs_1 = self._stack_coeffs(health_first_repeat_dict)
     
                 # create dataframe of all model runs and select the order based on median
                 health_df_1 = pd.DataFrame(health_coeffs_1, index=run, columns=self.features)
@@ -151,9 +244,10 @@ class Regressor_Chain():
 
                 if plot == 1:
                     # create graphs for model_1
-                    g_health_1 = sns.FacetGrid(health_df_1, row="feature", row_order=health_order_1,
-                        height=height, aspect=aspect, xlim=(low_lim, high_lim))
-                    g_health_1.map(sns.distplot, 'coeff_value', rug=True, hist=False, color="grey", kde_kws={"shade": True})
+                    g_health_1 = sns.displot(data=health_df_1, x="coeff_value", row="feature", row_order=health_order_1,
+                        kind="kde", common_norm=False, fill=True, rug=True, color="grey",
+                        height=height, aspect=aspect,
+                        facet_kws={"xlim": (low_lim, high_lim)})
 
                     plt.subplots_adjust(top=0.95)
                     g_health_1.fig.suptitle('Health Feature Coefficients, Economic dependent on Health Output')  
@@ -163,9 +257,10 @@ class Regressor_Chain():
                     plt.show()
                 
                 elif plot == 2:
-                    g_econ_1 = sns.FacetGrid(econ_df_1, row="feature", row_order=econ_order_1,
-                        height=height, aspect=aspect, xlim=(low_lim, high_lim))
-                    g_econ_1.map(sns.distplot, 'coeff_value', rug=True, hist=False, color="grey", kde_kws={"shade": True})
+                    g_econ_1 = sns.displot(data=econ_df_1, x="coeff_value", row="feature", row_order=econ_order_1,
+                        kind="kde", common_norm=False, fill=True, rug=True, color="grey",
+                        height=height, aspect=aspect,
+                        facet_kws={"xlim": (low_lim, high_lim)})
 
                     plt.subplots_adjust(top=0.95)
                     g_econ_1.fig.suptitle('Economic Feature Coefficients, Economic dependent on Health Output')  
@@ -179,10 +274,7 @@ class Regressor_Chain():
             elif plot == 3 or plot == 4:
 
                 # select the health first model and format the coeffs for use in graphs
-                econ_first_coeffs = [econ_first_repeat_dict[i][j] for i in range(self.repeats) for j in range(self.folds)]
-                health_coeffs_2 = np.array([item[0] for item in econ_first_coeffs])
-                health_coeffs_2 = health_coeffs_2[:,:self.num_features] # want only the feature coefficients, ignores the other target dependent coeff 
-                econ_coeffs_2 = np.array([item[1] for item in econ_first_coeffs])
+                health_coeffs_2, econ_coeffs_2 = self._stack_coeffs(econ_first_repeat_dict)
 
 
                 # create dataframe of all model runs and select the order based on median
@@ -198,9 +290,10 @@ class Regressor_Chain():
                 # create graphs for model_1
 
                 if plot == 3:
-                    g_health_2 = sns.FacetGrid(health_df_2, row="feature", row_order=health_order_2,
-                        height=height, aspect=aspect, xlim=(low_lim, high_lim))
-                    g_health_2.map(sns.distplot, 'coeff_value', rug=True, hist=False, color="grey", kde_kws={"shade": True})
+                    g_health_2 = sns.displot(data=health_df_2, x="coeff_value", row="feature", row_order=health_order_2,
+                        kind="kde", common_norm=False, fill=True, rug=True, color="grey",
+                        height=height, aspect=aspect,
+                        facet_kws={"xlim": (low_lim, high_lim)})
 
                     plt.subplots_adjust(top=0.95)
                     g_health_2.fig.suptitle('Health Feature Coefficients, Health dependent on Economic Output')  
@@ -210,9 +303,10 @@ class Regressor_Chain():
                     plt.show()
 
                 elif plot == 4:
-                    g_econ_2 = sns.FacetGrid(econ_df_2, row="feature", row_order=econ_order_2,
-                        height=height, aspect=aspect, xlim=(low_lim, high_lim))
-                    g_econ_2.map(sns.distplot, 'coeff_value', rug=True, hist=False, color="grey", kde_kws={"shade": True})
+                    g_econ_2 = sns.displot(data=econ_df_2, x="coeff_value", row="feature", row_order=econ_order_2,
+                        kind="kde", common_norm=False, fill=True, rug=True, color="grey",
+                        height=height, aspect=aspect,
+                        facet_kws={"xlim": (low_lim, high_lim)})
 
                     plt.subplots_adjust(top=0.95)
                     g_econ_2.fig.suptitle('Economic Feature Coefficients, Health dependent on Economic Output')  